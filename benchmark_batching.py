@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Compare batched and serial frame throughput using the stub backend.
+
+Each simulated client behaves like the browser page: it sends a frame, waits
+for its result, then sends the next one. The same workload is run with
+batching disabled (max batch size 1) and enabled, and the aggregate
+frames/sec of each run is reported.
+
+    python benchmark_batching.py --clients 8 --duration 10
+"""
+
+import argparse
+import base64
+import contextlib
+import io
+import threading
+import time
+
+from PIL import Image
+
+from mlx_smolvlm_webcam import EmbeddingCache, FrameRequest, MLXSmolVLMWebServer, ResponseCache, StubBackend
+
+
+class BenchmarkServer(MLXSmolVLMWebServer):
+    """Server that records results instead of emitting them over Socket.IO."""
+
+    def __init__(self, *args, **kwargs):
+        self.done_events = {}
+        self.latencies = []
+        self.completed = 0
+        super().__init__(*args, **kwargs)
+
+    def emit_result(self, frame_request: FrameRequest, payload: dict):
+        self.latencies.append(time.time() - frame_request.enqueued_at)
+        self.completed += 1
+        self.done_events[frame_request.sid].set()
+
+
+def make_frame(width: int, height: int) -> str:
+    """Build a synthetic JPEG data URL like the browser sends."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (90, 120, 200)).save(buffer, 'JPEG', quality=80)
+    return 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+
+def run_clients(server: BenchmarkServer, clients: int, duration: float, frame: str,
+                max_tokens: int) -> float:
+    """Run closed-loop clients for `duration` seconds and return frames/sec."""
+    stop_at = time.time() + duration
+
+    def client_loop(sid):
+        done = server.done_events[sid]
+        while time.time() < stop_at:
+            done.clear()
+            if server.worker.submit(FrameRequest(sid=sid, image=frame, prompt='What do you see?',
+                                                 max_tokens=max_tokens, temperature=0.0)):
+                done.wait()
+
+    threads = []
+    for i in range(clients):
+        sid = f"client-{i}"
+        server.done_events[sid] = threading.Event()
+        threads.append(threading.Thread(target=client_loop, args=(sid,)))
+
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return server.completed / (time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched vs serial throughput benchmark (stub backend)")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent simulated clients (default: 8)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per run (default: 10)")
+    parser.add_argument("--max-batch-size", type=int, default=8, help="Batch size for the batched run (default: 8)")
+    parser.add_argument("--batch-window", type=float, default=0.05, help="Batch window in seconds (default: 0.05)")
+    parser.add_argument("--max-tokens", type=int, default=30, help="Tokens per answer (default: 30)")
+    parser.add_argument("--stub-latency", type=float, default=0.3, help="Stub fixed latency (default: 0.3)")
+    parser.add_argument("--stub-tokens-per-sec", type=float, default=40.0, help="Stub decode rate (default: 40)")
+    args = parser.parse_args()
+
+    frame = make_frame(640, 480)
+    results = {}
+    for label, max_batch_size in (("serial", 1), ("batched", args.max_batch_size)):
+        backend = StubBackend(latency=args.stub_latency, tokens_per_sec=args.stub_tokens_per_sec)
+        # Every client sends the same frame, so the response and embedding caches must be off
+        server = BenchmarkServer('stub', backend=backend, max_queue=args.clients,
+                                 max_batch_size=max_batch_size, batch_window=args.batch_window,
+                                 response_cache=ResponseCache(max_entries=0),
+                                 embedding_cache=EmbeddingCache(max_entries=0))
+        # Silence the server's per-frame logging while measuring
+        with contextlib.redirect_stdout(io.StringIO()):
+            server.load_model()
+            fps = run_clients(server, args.clients, args.duration, frame, args.max_tokens)
+        latencies = sorted(server.latencies)
+        results[label] = fps
+        print(f"{label:>8}: {fps:6.2f} frames/sec, "
+              f"p50 latency {latencies[len(latencies) // 2]:.2f}s, "
+              f"avg batch {server.worker.stats()['avg_batch_size']:.2f}")
+
+    print(f"Speed-up: {results['batched'] / results['serial']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
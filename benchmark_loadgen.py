@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""End-to-end load generator for the webcam server.
+
+Opens N Socket.IO clients that send JPEG frames through the real
+`analyze_frame` protocol. By default each client behaves like the page in
+auto-analyze mode: it sends its next frame once the previous result is back,
+at most --fps times a second. With --open-loop it sends at --fps regardless,
+which exercises coalescing and the bounded queue. The tool reports latency
+percentiles, achieved frames/sec, dropped and superseded frames, and server
+CPU and memory (scraped from /metrics). Results are written as JSON for
+comparison between commits.
+
+    # Start a stub-backend server, load it with 8 clients for 30 seconds
+    python benchmark_loadgen.py --spawn-stub --clients 8 --duration 30 --output before.json
+    python benchmark_loadgen.py --spawn-stub --clients 8 -- --production --workers 2
+
+    # Against a running server, with recorded frames
+    python benchmark_loadgen.py --url http://127.0.0.1:8080 --frames recorded/ --fps 2
+"""
+
+import argparse
+import io
+import json
+import os
+import shlex
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from PIL import Image
+
+try:
+    import socketio
+except ImportError:
+    socketio = None
+
+
+def make_synthetic_frames(count: int, width: int, height: int, quality: int) -> list:
+    """JPEG frames whose colours shift enough per frame to count as a scene change."""
+    frames = []
+    gradient = Image.linear_gradient('L').resize((width, height))
+    for i in range(count):
+        shift = int(256 * i / count)
+        image = Image.merge('RGB', (
+            gradient.point(lambda value, shift=shift: (value + shift) % 256),
+            gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT),
+            Image.new('L', (width, height), (shift * 3) % 256),
+        ))
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=quality)
+        frames.append(buffer.getvalue())
+    return frames
+
+
+def load_recorded_frames(directory: str) -> list:
+    """Read every .jpg/.jpeg file in a directory, in name order."""
+    frames = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(('.jpg', '.jpeg')):
+            with open(os.path.join(directory, name), 'rb') as f:
+                frames.append(f.read())
+    if not frames:
+        raise ValueError(f"No JPEG frames found in {directory}")
+    return frames
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Nearest-rank percentile of a list of numbers (0.0 if empty)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def fetch(url: str, timeout: float = 5.0) -> tuple:
+    """GET a URL and return (status, body text); status is 0 if the server is unreachable."""
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.status, response.read().decode()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode()
+    except (urllib.error.URLError, OSError):
+        return 0, ""
+
+
+def scrape_metrics(url: str) -> dict:
+    """Parse the server's /metrics text into {'name{labels}': value}, skipping histogram buckets."""
+    status, body = fetch(f"{url}/metrics")
+    metrics = {}
+    if status != 200:
+        return metrics
+    for line in body.splitlines():
+        if not line or line.startswith('#') or '_bucket{' in line:
+            continue
+        name, _, value = line.rpartition(' ')
+        try:
+            metrics[name] = float(value)
+        except ValueError:
+            continue
+    return metrics
+
+
+def sum_series(metrics: dict, name: str):
+    """Sum every labelled series of a metric, or None if the server doesn't report it."""
+    values = [value for key, value in metrics.items() if key == name or key.startswith(name + '{')]
+    return sum(values) if values else None
+
+
+def wait_until_ready(url: str, timeout: float, server: subprocess.Popen = None) -> bool:
+    """Poll /health until the model is loaded and warmed up (or the spawned server exits)."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server is not None and server.poll() is not None:
+            return False
+        status, _ = fetch(f"{url}/health", timeout=2.0)
+        if status == 200:
+            return True
+        time.sleep(0.25)
+    return False
+
+
+class LoadClient:
+    """One simulated browser tab sending frames over Socket.IO."""
+
+    def __init__(self, index: int, url: str, frames: list, args):
+        self.index = index
+        self.url = url
+        self.frames = frames
+        self.args = args
+        self.sio = socketio.Client(reconnection=False)
+        self.lock = threading.Lock()
+        self.pending = {}  # request_id -> send time
+        self.result_ready = threading.Event()
+        self.sent = 0
+        self.latencies = []
+        self.server_times = []
+        self.completed = 0
+        self.cached = 0
+        self.dropped = 0
+        self.superseded = 0
+        self.errors = 0
+        self.sio.on('analysis_result', self.handle_result)
+
+    def handle_result(self, data):
+        now = time.perf_counter()
+        with self.lock:
+            sent_at = self.pending.pop(data.get('request_id'), None)
+            if data.get('superseded'):
+                self.superseded += 1
+            elif data.get('success'):
+                self.completed += 1
+                self.cached += bool(data.get('cached'))
+                if sent_at is not None:
+                    self.latencies.append(now - sent_at)
+                if 'server_total' in data.get('timings', {}):
+                    self.server_times.append(data['timings']['server_total'])
+            elif 'busy' in data.get('error', ''):
+                self.dropped += 1
+            else:
+                self.errors += 1
+        if not data.get('superseded'):
+            self.result_ready.set()
+
+    def connect(self):
+        self.sio.connect(self.url, transports=[self.args.transport], wait_timeout=10)
+
+    def send_frame(self):
+        request_id = f"{self.index}-{self.sent}"
+        frame = self.frames[(self.sent + self.index) % len(self.frames)]
+        with self.lock:
+            self.pending[request_id] = time.perf_counter()
+            self.sent += 1
+        self.sio.emit('analyze_frame', {
+            'image': frame,
+            'request_id': request_id,
+            'prompt': self.args.prompt,
+            'max_tokens': self.args.max_tokens,
+            'temperature': self.args.temperature,
+            'stream': False
+        })
+
+    def run(self, stop_at: float):
+        interval = 1.0 / self.args.fps if self.args.fps > 0 else 0.0
+        next_send = time.perf_counter()
+        while time.time() < stop_at:
+            self.result_ready.clear()
+            self.send_frame()
+            next_send += interval
+            if not self.args.open_loop:
+                # Like the page: wait for the answer before capturing the next frame
+                self.result_ready.wait(max(0.0, stop_at - time.time()))
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_send = time.perf_counter()
+
+    def close(self):
+        try:
+            self.sio.disconnect()
+        except Exception:
+            pass
+
+
+def spawn_stub_server(args) -> subprocess.Popen:
+    """Start the webcam server with the stub backend on --port."""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mlx_smolvlm_webcam.py')
+    command = [sys.executable, script, '--backend', 'stub', '--preload',
+               '--host', '127.0.0.1', '--port', str(args.port),
+               '--stub-latency', str(args.stub_latency),
+               '--stub-tokens-per-sec', str(args.stub_tokens_per_sec)] + shlex.split(args.server_args)
+    return subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def git_commit() -> str:
+    """Current commit of the checkout, to label results."""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_load(url: str, frames: list, args) -> dict:
+    """Connect the clients, drive them for --duration seconds and summarize the run."""
+    clients = [LoadClient(i, url, frames, args) for i in range(args.clients)]
+    for client in clients:
+        client.connect()
+
+    metrics_before = scrape_metrics(url)
+    start = time.time()
+    stop_at = start + args.duration
+    threads = [threading.Thread(target=client.run, args=(stop_at,)) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Rates and CPU cover the sending window; the drain only collects late answers
+    elapsed = time.time() - start
+    metrics_sent = scrape_metrics(url)
+    # Let in-flight answers arrive before counting the rest as unanswered
+    time.sleep(args.drain)
+    metrics_after = scrape_metrics(url)
+
+    for client in clients:
+        client.close()
+
+    latencies = [latency for client in clients for latency in client.latencies]
+    server_times = [value for client in clients for value in client.server_times]
+    sent = sum(client.sent for client in clients)
+    completed = sum(client.completed for client in clients)
+
+    # Summed over the server process and, with --workers, each model worker
+    server = {}
+    cpu_before = sum_series(metrics_before, 'smolvlm_process_cpu_seconds_total')
+    cpu_sent = sum_series(metrics_sent, 'smolvlm_process_cpu_seconds_total')
+    if cpu_before is not None and cpu_sent is not None:
+        server['cpu_percent'] = round(100 * (cpu_sent - cpu_before) / elapsed, 1)
+    max_rss = sum_series(metrics_after, 'smolvlm_process_max_resident_memory_bytes')
+    if max_rss is not None:
+        server['max_rss_mb'] = round(max_rss / 2 ** 20, 1)
+        server['processes'] = sum(1 for name in metrics_after
+                                  if name.startswith('smolvlm_process_max_resident_memory_bytes'))
+    for source in ('model', 'scene_skip', 'response_cache'):
+        key = f'smolvlm_results_total{{source="{source}"}}'
+        if key in metrics_after:
+            server[f'results_{source}'] = metrics_after[key] - metrics_before.get(key, 0)
+
+    return {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'config': {
+            'url': url,
+            'server_args': args.server_args,
+            'clients': args.clients,
+            'duration': args.duration,
+            'fps_per_client': args.fps,
+            'open_loop': args.open_loop,
+            'transport': args.transport,
+            'frames': len(frames),
+            'frame_bytes_avg': round(sum(len(frame) for frame in frames) / len(frames)),
+            'max_tokens': args.max_tokens,
+            'temperature': args.temperature,
+        },
+        'frames_sent': sent,
+        'frames_completed': completed,
+        'frames_cached': sum(client.cached for client in clients),
+        'frames_dropped': sum(client.dropped for client in clients),
+        'frames_superseded': sum(client.superseded for client in clients),
+        'errors': sum(client.errors for client in clients),
+        'unanswered': sum(len(client.pending) for client in clients),
+        'sent_fps': round(sent / elapsed, 2),
+        'achieved_fps': round(completed / elapsed, 2),
+        'latency_ms': {
+            'p50': round(1000 * percentile(latencies, 0.50), 1),
+            'p95': round(1000 * percentile(latencies, 0.95), 1),
+            'p99': round(1000 * percentile(latencies, 0.99), 1),
+            'max': round(1000 * max(latencies, default=0.0), 1),
+        },
+        'server_time_ms_p50': round(1000 * percentile(server_times, 0.50), 1),
+        'server': server,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Socket.IO load generator for the webcam server")
+    parser.add_argument("--url", type=str, default=None,
+                        help="Server to load (default: spawn-stub server, or http://127.0.0.1:PORT)")
+    parser.add_argument("--spawn-stub", action="store_true",
+                        help="Start the server with the stub backend for the run and stop it afterwards")
+    parser.add_argument("--port", type=int, default=8090, help="Port for --spawn-stub (default: 8090)")
+    parser.add_argument("--stub-latency", type=float, default=0.3, help="Stub fixed latency (default: 0.3)")
+    parser.add_argument("--stub-tokens-per-sec", type=float, default=40.0, help="Stub decode rate (default: 40)")
+    parser.add_argument("--server-args", type=str, default="",
+                        help="Extra arguments for the --spawn-stub server; write --server-args=\"--production\" "
+                             "(with =), or put them after --")
+    parser.add_argument("--clients", type=int, default=4, help="Simulated clients (default: 4)")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds to send frames (default: 20)")
+    parser.add_argument("--fps", type=float, default=2.0, help="Frames/sec per client, 0 for unpaced (default: 2)")
+    parser.add_argument("--open-loop", action="store_true",
+                        help="Send at --fps without waiting for results (default: wait like the page does)")
+    parser.add_argument("--drain", type=float, default=3.0,
+                        help="Seconds to wait for in-flight results after sending stops (default: 3)")
+    parser.add_argument("--frames", type=str, default=None,
+                        help="Directory of recorded JPEG frames (default: synthetic frames)")
+    parser.add_argument("--frame-size", type=str, default="640x480", help="Synthetic frame size (default: 640x480)")
+    parser.add_argument("--transport", type=str, choices=["websocket", "polling"], default="websocket",
+                        help="Socket.IO transport (default: websocket)")
+    parser.add_argument("--prompt", type=str, default="What do you see?", help="Prompt sent with every frame")
+    parser.add_argument("--max-tokens", type=int, default=30, help="Max tokens per answer (default: 30)")
+    parser.add_argument("--temperature", type=float, default=0.2,
+                        help="Sampling temperature; 0 makes answers cacheable (default: 0.2)")
+    parser.add_argument("--output", type=str, default=None, help="Write the results as JSON to this file")
+    # Everything after -- goes to the spawned server, since argparse won't take "--production" as a value
+    argv = sys.argv[1:]
+    extra = []
+    if '--' in argv:
+        split = argv.index('--')
+        argv, extra = argv[:split], argv[split + 1:]
+    args = parser.parse_args(argv)
+    args.server_args = shlex.join(shlex.split(args.server_args) + extra)
+
+    if socketio is None:
+        print("Error: python-socketio is required. Install with: pip install \"python-socketio[client]\"")
+        return 1
+
+    if args.frames:
+        frames = load_recorded_frames(args.frames)
+    else:
+        width, height = (int(value) for value in args.frame_size.lower().split('x'))
+        frames = make_synthetic_frames(32, width, height, quality=80)
+
+    server = spawn_stub_server(args) if args.spawn_stub else None
+    url = args.url or f"http://127.0.0.1:{args.port}"
+    try:
+        if not wait_until_ready(url, timeout=60, server=server):
+            print(f"❌ Server at {url} did not become ready")
+            return 1
+        print(f"🚦 {args.clients} clients -> {url} for {args.duration:.0f}s "
+              f"({'open' if args.open_loop else 'closed'} loop, {args.fps} fps each)")
+        results = run_load(url, frames, args)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+    latency = results['latency_ms']
+    print(f"Frames: {results['frames_sent']} sent, {results['frames_completed']} completed "
+          f"({results['frames_cached']} cached), {results['frames_dropped']} dropped, "
+          f"{results['frames_superseded']} superseded, {results['errors']} errors, "
+          f"{results['unanswered']} unanswered")
+    print(f"Throughput: {results['achieved_fps']:.2f} frames/sec (sent {results['sent_fps']:.2f})")
+    print(f"Latency: p50 {latency['p50']:.0f}ms, p95 {latency['p95']:.0f}ms, p99 {latency['p99']:.0f}ms")
+    if results['server']:
+        print(f"Server ({results['server'].get('processes', '?')} processes): "
+              f"{results['server'].get('cpu_percent', '?')}% CPU, "
+              f"{results['server'].get('max_rss_mb', '?')} MiB peak RSS")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
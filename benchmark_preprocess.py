@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Micro-benchmark of per-frame preprocessing time across input resolutions.
+
+Compares the original path (full decode + LANCZOS thumbnail) with
+decode_frame_image (JPEG draft-mode decode + bilinear resize) on synthetic
+camera-like JPEGs.
+
+    python benchmark_preprocess.py --iterations 50
+"""
+
+import argparse
+import io
+import time
+
+from PIL import Image, ImageFilter
+
+from mlx_smolvlm_webcam import decode_frame_image
+
+RESOLUTIONS = [(640, 480), (1280, 720), (1920, 1080), (2560, 1440), (3840, 2160)]
+
+
+def make_jpeg(width: int, height: int, quality: int = 80) -> bytes:
+    """Build a JPEG with camera-like detail (blurred noise over a gradient)."""
+    noise = Image.effect_noise((width, height), 60).filter(ImageFilter.GaussianBlur(1.5))
+    gradient = Image.linear_gradient('L').resize((width, height))
+    image = Image.merge('RGB', (noise, gradient, Image.blend(noise, gradient, 0.5)))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def legacy_preprocess(image_bytes: bytes, max_size: int) -> Image.Image:
+    """The original handler's path: full decode, then LANCZOS thumbnail."""
+    image = Image.open(io.BytesIO(image_bytes))
+    if max(image.size) > max_size:
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+    return image.convert('RGB')
+
+
+def time_per_frame(fn, image_bytes: bytes, max_size: int, iterations: int) -> float:
+    """Return the mean milliseconds per call."""
+    fn(image_bytes, max_size)  # warm-up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(image_bytes, max_size)
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frame preprocessing micro-benchmark")
+    parser.add_argument("--iterations", type=int, default=30, help="Frames per measurement (default: 30)")
+    parser.add_argument("--max-size", type=int, default=768, help="Target longest edge (default: 768)")
+    args = parser.parse_args()
+
+    print(f"{'input':>11} {'jpeg KB':>8} {'legacy ms':>10} {'fast ms':>8} {'speed-up':>9}")
+    for width, height in RESOLUTIONS:
+        image_bytes = make_jpeg(width, height)
+        legacy = time_per_frame(legacy_preprocess, image_bytes, args.max_size, args.iterations)
+        fast = time_per_frame(decode_frame_image, image_bytes, args.max_size, args.iterations)
+        print(f"{width:>5}x{height:<5} {len(image_bytes) / 1024:>8.0f} {legacy:>10.2f} {fast:>8.2f} {legacy / fast:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,19 +2,52 @@
 
 import argparse
 import base64
+import hashlib
 import io
-from typing import Optional
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
 
-from flask import Flask, render_template_string
-from flask_socketio import SocketIO
+from flask import Flask, Response, jsonify, render_template_string, request
+from flask_socketio import SocketIO, join_room, leave_room
 from PIL import Image
 
+# mlx-vlm only runs on Apple Silicon; without it the server can still run
+# against the stub backend (e.g. for load-testing on Linux CI boxes).
 try:
-    from mlx_vlm import load, generate
-    from mlx_vlm.utils import load_config
+    from mlx_vlm import load, generate, stream_generate
+    MLX_VLM_AVAILABLE = True
 except ImportError:
-    print("Error: mlx-vlm is required. Install with: pip install mlx-vlm")
-    exit(1)
+    MLX_VLM_AVAILABLE = False
+
+# Batched generation is only available in newer mlx-vlm releases
+try:
+    from mlx_vlm import batch_generate
+    MLX_VLM_BATCH_AVAILABLE = True
+except ImportError:
+    MLX_VLM_BATCH_AVAILABLE = False
+
+# OpenCV reads video files for the offline batch mode; image directories work without it
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
+# Process CPU and memory for /metrics; the resource module is Unix-only
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    RESOURCE_AVAILABLE = False
 
 # HTML Template
 HTML_TEMPLATE = """
@@ -198,7 +231,7 @@ HTML_TEMPLATE = """
             font-weight: 500;
         }
 
-        .setting-item input, .setting-item select {
+        .setting-item input, .setting-item select, .setting-item textarea {
             padding: 8px;
             border: none;
             border-radius: 5px;
@@ -248,6 +281,13 @@ HTML_TEMPLATE = """
             color: #fff;
         }
         
+        .timings {
+            margin-top: 10px;
+            font-size: 12px;
+            font-family: monospace;
+            opacity: 0.8;
+        }
+        
         .previous-response {
             opacity: 0.7;
             margin-bottom: 5px;
@@ -276,6 +316,7 @@ HTML_TEMPLATE = """
                 <div class="controls">
                     <button id="startCamera">Start Camera</button>
                     <button id="analyzeBtn" disabled>📸 Analyze Frame</button>
+                    <button id="reanalyzeBtn" disabled title="Ask the current prompt about the last analyzed frame">🔁 Ask Again</button>
                     <button id="toggleCamera" disabled>⏸️ Pause</button>
                 </div>
             </div>
@@ -284,6 +325,7 @@ HTML_TEMPLATE = """
                 <h3>🧠 AI Response</h3>
                 <div id="errorContainer"></div>
                 <div id="response">Click "Start Camera" and then "Analyze Frame" to begin...</div>
+                <div id="timings" class="timings"></div>
             </div>
         </div>
         
@@ -295,13 +337,37 @@ HTML_TEMPLATE = """
                     <input type="text" id="promptInput" class="prompt-input" 
                            placeholder="Briefly describe what you see...">
                 </div>
+                <div class="setting-item">
+                    <label for="extraPrompts">Extra Prompts (one per line):</label>
+                    <textarea id="extraPrompts" class="prompt-input" rows="3"
+                              placeholder="Count the people&#10;Read any visible text"></textarea>
+                </div>
                 <div class="setting-item">
                     <label for="maxTokens">Max Tokens:</label>
                     <input type="number" id="maxTokens" value="30" min="5" max="50">
                 </div>
                 <div class="setting-item">
                     <label for="temperature">Temperature:</label>
-                    <input type="number" id="temperature" value="0.2" min="0.1" max="1.0" step="0.1">
+                    <input type="number" id="temperature" value="0.2" min="0" max="1.0" step="0.1">
+                </div>
+                <div class="setting-item">
+                    <label for="streamTokens">Stream Tokens:</label>
+                    <select id="streamTokens">
+                        <option value="true">On</option>
+                        <option value="false" selected>Off</option>
+                    </select>
+                </div>
+                <div class="setting-item">
+                    <label for="frameTransport">Frame Upload:</label>
+                    <select id="frameTransport">
+                        <option value="binary" selected>Binary JPEG</option>
+                        <option value="dataurl">Base64 Data URL</option>
+                    </select>
+                </div>
+                <div class="setting-item">
+                    <label for="cameraRoom">Camera Room:</label>
+                    <input type="text" id="cameraRoom" class="prompt-input"
+                           placeholder="Blank for a private session">
                 </div>
                 <div class="setting-item">
                     <label for="autoAnalyze">Auto Analyze:</label>
@@ -323,13 +389,22 @@ HTML_TEMPLATE = """
     <script>
         class SmolVLMWebcam {
             constructor() {
-                this.socket = io();
+                // Production servers accept WebSocket only, so skip the long-polling handshake
+                this.socket = io({ transports: {{ transports|tojson }} });
                 this.video = document.getElementById('video');
                 this.canvas = document.createElement('canvas');
                 this.ctx = this.canvas.getContext('2d');
                 this.stream = null;
                 this.isProcessing = false;
                 this.autoAnalyzeInterval = null;
+                this.streamedText = '';
+                this.lastFrameId = null;
+                // Processing size and JPEG quality, replaced by the server's server_config
+                this.maxImageSize = 768;
+                this.jpegQuality = 0.8;
+                // Shared camera room, and whether this page supplies its frames
+                this.cameraRoom = '';
+                this.isProducer = false;
                 
                 this.initializeElements();
                 this.setupSocketEvents();
@@ -339,21 +414,33 @@ HTML_TEMPLATE = """
             initializeElements() {
                 this.startCameraBtn = document.getElementById('startCamera');
                 this.analyzeBtn = document.getElementById('analyzeBtn');
+                this.reanalyzeBtn = document.getElementById('reanalyzeBtn');
                 this.toggleCameraBtn = document.getElementById('toggleCamera');
                 this.statusIndicator = document.getElementById('statusIndicator');
                 this.statusText = document.getElementById('statusText');
                 this.responseDiv = document.getElementById('response');
+                this.timingsDiv = document.getElementById('timings');
+                // Send time of each request still awaiting a result, by request id
+                this.pendingRequests = new Map();
+                this.nextRequestId = 1;
                 this.errorContainer = document.getElementById('errorContainer');
                 this.promptInput = document.getElementById('promptInput');
+                this.extraPromptsInput = document.getElementById('extraPrompts');
                 this.maxTokensInput = document.getElementById('maxTokens');
                 this.temperatureInput = document.getElementById('temperature');
+                this.streamSelect = document.getElementById('streamTokens');
+                this.transportSelect = document.getElementById('frameTransport');
                 this.autoAnalyzeSelect = document.getElementById('autoAnalyze');
+                this.cameraRoomInput = document.getElementById('cameraRoom');
             }
             
             setupSocketEvents() {
                 this.socket.on('connect', () => {
                     console.log('Connected to server');
                     this.updateStatus('connected', 'Connected to server');
+                    this.sendSettings();
+                    // Rooms don't survive a reconnect; join again
+                    this.joinCameraRoom();
                 });
                 
                 this.socket.on('disconnect', () => {
@@ -361,10 +448,43 @@ HTML_TEMPLATE = """
                     this.updateStatus('error', 'Disconnected from server');
                 });
                 
+                this.socket.on('model_status', (data) => {
+                    this.handleModelStatus(data);
+                });
+                
+                this.socket.on('server_config', (data) => {
+                    this.maxImageSize = data.max_image_size || this.maxImageSize;
+                    this.jpegQuality = data.jpeg_quality || this.jpegQuality;
+                    console.log(`Server processes frames at ${this.maxImageSize}px, JPEG quality ${this.jpegQuality}`);
+                });
+                
+                this.socket.on('analysis_token', (data) => {
+                    this.handleAnalysisToken(data);
+                });
+                
                 this.socket.on('analysis_result', (data) => {
                     this.handleAnalysisResult(data);
                 });
                 
+                this.socket.on('camera_joined', (data) => {
+                    if (data.camera !== this.cameraRoom) return;
+                    this.isProducer = data.producer;
+                    this.updateStatus('connected', data.producer ? `Sharing camera to room "${data.camera}"`
+                                                                 : `Watching room "${data.camera}"`);
+                });
+                
+                this.socket.on('camera_error', (data) => {
+                    if (data.camera !== this.cameraRoom) return;
+                    this.cameraRoom = '';
+                    this.handleError(data.error);
+                });
+                
+                this.socket.on('camera_result', (data) => {
+                    // One result per room analysis, whoever sent the frame; request ids are the room's own
+                    if (data.camera !== this.cameraRoom) return;
+                    this.handleAnalysisResult({ ...data, request_id: null });
+                });
+                
                 this.socket.on('error', (data) => {
                     this.handleError(data.message);
                 });
@@ -373,8 +493,45 @@ HTML_TEMPLATE = """
             setupEventListeners() {
                 this.startCameraBtn.addEventListener('click', () => this.startCamera());
                 this.analyzeBtn.addEventListener('click', () => this.analyzeFrame());
+                this.reanalyzeBtn.addEventListener('click', () => this.reanalyzeFrame());
                 this.toggleCameraBtn.addEventListener('click', () => this.toggleCamera());
                 this.autoAnalyzeSelect.addEventListener('change', () => this.updateAutoAnalyze());
+                this.cameraRoomInput.addEventListener('change', () => this.joinCameraRoom());
+                [this.promptInput, this.extraPromptsInput, this.maxTokensInput, this.temperatureInput, this.streamSelect].forEach(input => {
+                    input.addEventListener('change', () => this.sendSettings());
+                });
+            }
+            
+            getSettings() {
+                const prompt = this.promptInput.value.trim() || 'Tell me what you see.';
+                const extraPrompts = this.extraPromptsInput.value.split('\n').map(p => p.trim()).filter(p => p);
+                return {
+                    prompt: prompt,
+                    // With extra prompts the server answers all of them about the same frame in one batch
+                    prompts: extraPrompts.length ? [prompt, ...extraPrompts] : [],
+                    max_tokens: parseInt(this.maxTokensInput.value) || 30,
+                    // 0 is a valid (deterministic, cacheable) temperature
+                    temperature: isNaN(parseFloat(this.temperatureInput.value)) ? 0.2 : parseFloat(this.temperatureInput.value),
+                    stream: this.streamSelect.value === 'true'
+                };
+            }
+            
+            sendSettings() {
+                // The server keeps these per connection for this client's frames
+                this.socket.emit('update_settings', this.getSettings());
+            }
+            
+            joinCameraRoom() {
+                const room = this.cameraRoomInput.value.trim();
+                if (this.cameraRoom && this.cameraRoom !== room) {
+                    this.socket.emit('leave_camera', { camera: this.cameraRoom });
+                }
+                this.cameraRoom = room;
+                this.isProducer = false;
+                this.isProcessing = false;
+                if (room) {
+                    this.socket.emit('join_camera', { camera: room });
+                }
             }
             
             async startCamera() {
@@ -402,27 +559,100 @@ HTML_TEMPLATE = """
             }
             
             captureFrame() {
-                if (!this.stream) return null;
+                if (!this.stream) return Promise.resolve(null);
                 
-                this.canvas.width = this.video.videoWidth;
-                this.canvas.height = this.video.videoHeight;
-                this.ctx.drawImage(this.video, 0, 0);
+                // Downscale to the server's processing size; it would discard the extra pixels anyway
+                const width = this.video.videoWidth;
+                const height = this.video.videoHeight;
+                const scale = Math.min(1, this.maxImageSize / Math.max(width, height));
+                this.canvas.width = Math.round(width * scale);
+                this.canvas.height = Math.round(height * scale);
+                this.ctx.drawImage(this.video, 0, 0, this.canvas.width, this.canvas.height);
                 
-                return this.canvas.toDataURL('image/jpeg', 0.8);
+                if (this.transportSelect.value === 'dataurl') {
+                    return Promise.resolve(this.canvas.toDataURL('image/jpeg', this.jpegQuality));
+                }
+                // Raw JPEG bytes go out as a Socket.IO binary attachment, no base64
+                return new Promise(resolve => {
+                    this.canvas.toBlob(blob => resolve(blob ? blob.arrayBuffer() : null), 'image/jpeg', this.jpegQuality);
+                });
             }
             
-            analyzeFrame() {
+            async analyzeFrame() {
                 if (this.isProcessing) return;
+                // In a camera room only the producer sends frames; everyone gets the room's results
+                if (this.cameraRoom && !this.isProducer) return;
                 
-                const frameData = this.captureFrame();
+                // Claim the slot before the async encode so a timer tick can't capture twice
+                this.isProcessing = true;
+                const frameData = await this.captureFrame();
                 if (!frameData) {
                     this.handleError('No camera frame available');
                     return;
                 }
                 
+                this.showAnalyzing();
+                
+                const frameBytes = typeof frameData === 'string' ? frameData.length : frameData.byteLength;
+                console.log(`Frame upload: ${frameBytes} bytes (${this.transportSelect.value})`);
+                
+                this.streamedText = '';
+                this.socket.emit('analyze_frame', {
+                    image: frameData,
+                    ...(this.cameraRoom ? { camera: this.cameraRoom } : { request_id: this.trackRequest() }),
+                    ...this.getSettings()
+                });
+            }
+            
+            reanalyzeFrame() {
+                // Ask the current prompt about the last uploaded frame without sending it again
+                if (this.isProcessing || !this.lastFrameId) return;
+                
                 this.isProcessing = true;
+                this.showAnalyzing();
+                this.streamedText = '';
+                this.socket.emit('reanalyze', {
+                    frame_id: this.lastFrameId,
+                    request_id: this.trackRequest(),
+                    ...this.getSettings()
+                });
+            }
+            
+            trackRequest() {
+                const requestId = this.nextRequestId++;
+                this.pendingRequests.set(requestId, performance.now());
+                return requestId;
+            }
+            
+            renderTimings(timings, roundTrip) {
+                // Client round trip, then where the server spent its part of it
+                const ms = (seconds) => `${Math.round(seconds * 1000)}ms`;
+                const parts = [];
+                if (roundTrip !== null) {
+                    parts.push(`round trip ${ms(roundTrip)}`);
+                    if (timings.server_total !== undefined) {
+                        parts.push(`network ~${ms(Math.max(0, roundTrip - timings.server_total))}`);
+                    }
+                }
+                const labels = [['queue_wait', 'queue'], ['decode', 'decode'], ['preprocess', 'preprocess'],
+                                ['time_to_first_token', 'first token'], ['generation', 'generation']];
+                for (const [key, label] of labels) {
+                    if (timings[key] !== undefined) parts.push(`${label} ${ms(timings[key])}`);
+                }
+                if (timings.tokens !== undefined) {
+                    const rate = timings.generation ? ` (${(timings.tokens / timings.generation).toFixed(1)} tok/s)` : '';
+                    parts.push(`${timings.tokens} tokens${rate}`);
+                }
+                if (timings.tokens_saved) {
+                    parts.push(`${timings.tokens_saved} saved by stopping at a sentence end`);
+                }
+                this.timingsDiv.textContent = parts.length ? `⏱️ ${parts.join(' · ')}` : '';
+            }
+            
+            showAnalyzing() {
                 this.updateStatus('processing', 'Processing...');
                 this.analyzeBtn.disabled = true;
+                this.reanalyzeBtn.disabled = true;
                 
                 // Show analyzing message while keeping previous response visible
                 const currentResponse = this.responseDiv.textContent;
@@ -431,26 +661,54 @@ HTML_TEMPLATE = """
                 } else {
                     this.responseDiv.innerHTML = '<div class="analyzing-message">🔍 Analyzing...</div>';
                 }
-                
-                const prompt = this.promptInput.value.trim() || 'Tell me what you see.';
-                const maxTokens = parseInt(this.maxTokensInput.value) || 30;
-                const temperature = parseFloat(this.temperatureInput.value) || 0.2;
-                
-                this.socket.emit('analyze_frame', {
-                    image: frameData,
-                    prompt: prompt,
-                    max_tokens: maxTokens,
-                    temperature: temperature
-                });
+            }
+            
+            handleAnalysisToken(data) {
+                // Show the answer as it is decoded; the final result replaces this draft
+                this.streamedText += data.token;
+                this.responseDiv.textContent = this.streamedText;
             }
             
             handleAnalysisResult(data) {
+                let roundTrip = null;
+                if (this.pendingRequests.has(data.request_id)) {
+                    roundTrip = (performance.now() - this.pendingRequests.get(data.request_id)) / 1000;
+                    this.pendingRequests.delete(data.request_id);
+                }
+                
+                // A newer frame replaced this one on the server; its result is still coming
+                if (data.superseded) return;
+                
+                if (data.timings) {
+                    this.renderTimings(data.timings, roundTrip);
+                }
+                if (data.quality) {
+                    this.timingsDiv.textContent += ` · quality ${data.quality.image_edge}px/${data.quality.max_tokens} tokens`;
+                }
+                
+                this.streamedText = '';
                 this.isProcessing = false;
                 this.analyzeBtn.disabled = false;
-                this.updateStatus('ready', 'Analysis complete');
+                if (data.frame_id) {
+                    this.lastFrameId = data.frame_id;
+                }
+                this.reanalyzeBtn.disabled = !this.lastFrameId;
+                let status = 'Analysis complete';
+                if (data.scene_change !== undefined) {
+                    status = 'Scene unchanged';
+                } else if (data.cached) {
+                    status = 'Cached answer';
+                }
+                this.updateStatus('ready', status);
                 
                 if (data.success) {
-                    this.responseDiv.textContent = data.response;
+                    if (data.responses) {
+                        this.responseDiv.textContent = Object.entries(data.responses)
+                            .map(([prompt, answer]) => `${prompt}\n→ ${answer}`)
+                            .join('\n\n');
+                    } else {
+                        this.responseDiv.textContent = data.response;
+                    }
                     this.clearError();
                 } else {
                     this.handleError(data.error || 'Analysis failed');
@@ -491,6 +749,18 @@ HTML_TEMPLATE = """
                 }
             }
             
+            handleModelStatus(data) {
+                if (data.state === 'loading') {
+                    this.updateStatus('processing', 'Loading model...');
+                } else if (data.state === 'warming_up') {
+                    this.updateStatus('processing', 'Warming up model...');
+                } else if (data.state === 'failed') {
+                    this.handleError(`Failed to load model: ${data.error}`);
+                } else if (data.state === 'ready' && !this.isProcessing) {
+                    this.updateStatus(this.stream ? 'ready' : 'connected', 'Model ready');
+                }
+            }
+            
             updateStatus(type, message) {
                 this.statusIndicator.className = `status-indicator ${type}`;
                 this.statusText.textContent = message;
@@ -502,6 +772,7 @@ HTML_TEMPLATE = """
                 this.updateStatus('error', 'Error occurred');
                 this.isProcessing = false;
                 this.analyzeBtn.disabled = false;
+                this.reanalyzeBtn.disabled = !this.lastFrameId;
             }
             
             clearError() {
@@ -518,263 +789,3345 @@ HTML_TEMPLATE = """
 </html>
 """
 
-class MLXSmolVLMWebServer:
-    def __init__(self, model_path: str, host: str = "localhost", port: int = 8080):
-        """Initialize the MLX SmolVLM web server."""
+@dataclass
+class PreparedPrompt:
+    """A prompt formatted (and, where the backend can, tokenized) for the model."""
+    prompt: str
+    text: str
+    token_ids: Optional[list] = None
+    # Seconds spent formatting/tokenizing, saved on every cache hit
+    prepare_time: float = 0.0
+    # Seconds of text prefill, saved on every hit once prefix_state is set
+    prefill_time: float = 0.0
+    # Backend-specific KV state for the prompt's text tokens, reused across requests
+    prefix_state: Any = None
+
+
+@dataclass
+class EncodedImage:
+    """A preprocessed frame plus, once a backend has computed them, its vision features.
+
+    Backends that can reuse vision-encoder output attach it to `features`
+    during generation; a later prompt on the same EncodedImage skips the
+    vision tower.
+    """
+    image: Image.Image
+    # Vision encoder + connector output; None until a backend attaches it
+    features: Any = None
+    nbytes: int = 0
+
+    @classmethod
+    def from_image(cls, image: Image.Image) -> 'EncodedImage':
+        return cls(image=image, nbytes=image.width * image.height * len(image.getbands()))
+
+
+class PromptCache:
+    """LRU cache of prepared prompts, keyed by prompt text.
+
+    In auto-analyze mode the prompt is identical frame after frame, so the
+    chat formatting, tokenization and (where the backend supports it) the
+    text-side KV state are computed once and reused.
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.prefill_saved = 0.0
+
+    def get(self, prompt: str) -> Optional[PreparedPrompt]:
+        with self.lock:
+            prepared = self.entries.get(prompt)
+            if prepared is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(prompt)
+            self.hits += 1
+            return prepared
+
+    def put(self, prepared: PreparedPrompt):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[prepared.prompt] = prepared
+            self.entries.move_to_end(prepared.prompt)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def record_saving(self, seconds: float):
+        with self.lock:
+            self.prefill_saved += seconds
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'prefill_saved_total': self.prefill_saved,
+            }
+
+
+class InferenceBackend:
+    """Interface the web server uses to load and run a vision language model."""
+
+    name = "base"
+
+    def __init__(self, prompt_cache_size: int = 64):
+        self.loaded = False
+        self.prompt_cache = PromptCache(max_entries=prompt_cache_size)
+        # Phase seconds (vision_encode, prefill, decode_tokens) and token count of the
+        # latest generation, as far as the backend can tell. Only the inference worker
+        # calls the backend, so this is never written concurrently.
+        self.last_timings = {}
+
+    def load(self):
+        """Load the model. Raises on failure."""
+        raise NotImplementedError
+
+    # Whether generate_batch() runs the batch in one model call
+    supports_batching = False
+
+    def format_prompt(self, prompt: str) -> PreparedPrompt:
+        """Format a user prompt for the model (uncached)."""
+        # Format prompt with image placeholder
+        return PreparedPrompt(prompt=prompt, text=f"<image>\n{prompt}")
+
+    def prepare_prompt(self, prompt: str) -> tuple:
+        """Return (prepared prompt, seconds of prompt work saved by the cache)."""
+        prepared = self.prompt_cache.get(prompt)
+        if prepared is not None:
+            saved = prepared.prepare_time
+            if prepared.prefix_state is not None:
+                saved += prepared.prefill_time
+            self.prompt_cache.record_saving(saved)
+            return prepared, saved
+
+        start_time = time.perf_counter()
+        prepared = self.format_prompt(prompt)
+        prepared.prepare_time = time.perf_counter() - start_time
+        self.prompt_cache.put(prepared)
+        return prepared, 0.0
+
+    def generate(self, image: EncodedImage, prompt: PreparedPrompt, max_tokens: int, temperature: float,
+                 stopper: Optional['SentenceStopper'] = None) -> str:
+        """Generate a raw text response for one image and prompt.
+
+        With a stopper, decoding ends as soon as stopper.feed() says so.
+        """
+        raise NotImplementedError
+
+    def record_timings(self, vision_encode: Optional[float] = None, prefill: Optional[float] = None,
+                       decode_tokens: Optional[float] = None, tokens: Optional[int] = None):
+        """Store the phase breakdown of the latest generation; unknown phases are left out."""
+        timings = {'vision_encode': vision_encode, 'prefill': prefill,
+                   'decode_tokens': decode_tokens, 'tokens': tokens}
+        self.last_timings = {key: value for key, value in timings.items() if value is not None}
+
+    def stream_generate(self, image: EncodedImage, prompt: PreparedPrompt, max_tokens: int, temperature: float,
+                        stopper: Optional['SentenceStopper'] = None):
+        """Yield the raw response in text chunks as they are decoded.
+
+        The default yields the whole response at once; backends with a token
+        iterator override this.
+        """
+        yield self.generate(image, prompt, max_tokens, temperature, stopper)
+
+    def generate_batch(self, images: list, prompts: list, max_tokens: int, temperature: float,
+                       stoppers: Optional[list] = None) -> list:
+        """Generate one raw response per (image, prepared prompt) pair, with an optional stopper each.
+
+        The default runs the pairs one after another; backends that can encode
+        and prefill several images at once override this.
+        """
+        responses = []
+        totals = {}
+        for i, (image, prompt) in enumerate(zip(images, prompts)):
+            responses.append(self.generate(image, prompt, max_tokens, temperature, stoppers[i] if stoppers else None))
+            for key, value in self.last_timings.items():
+                totals[key] = totals.get(key, 0) + value
+        self.last_timings = totals
+        return responses
+
+    def image_size(self) -> Optional[dict]:
+        """Return the image size the model processes, if known."""
+        return None
+
+    def processing_size(self) -> int:
+        """Longest image edge the model processes, from the image processor's size."""
+        size = self.image_size() or {}
+        if 'longest_edge' in size:
+            return int(size['longest_edge'])
+        if 'height' in size and 'width' in size:
+            return int(max(size['height'], size['width']))
+        return 2 * 384  # N=2 * 384 for good speed/quality balance
+
+    def set_image_edge(self, edge: int):
+        """Change the longest image edge the model processes."""
+        pass
+
+    def count_tokens(self, text: str) -> int:
+        """Number of tokens in a generated text (whitespace words unless the backend has a tokenizer)."""
+        return len(text.split())
+
+    def warm_up(self, image_edge: int, max_tokens: int = 4):
+        """Run a throwaway generation on a synthetic frame so kernels are compiled before real traffic."""
+        # A 4:3 webcam-shaped frame at the size frames are processed at
+        frame = Image.new('RGB', (image_edge, image_edge * 3 // 4), (128, 128, 128))
+        self.generate(EncodedImage.from_image(frame), self.format_prompt("Describe the image."),
+                      max_tokens=max_tokens, temperature=0.0)
+
+
+class MLXBackend(InferenceBackend):
+    """Backend running SmolVLM through mlx-vlm on Apple Silicon.
+
+    SmolVLM places the image tokens before the prompt text and mlx-vlm's
+    generate() builds a fresh KV cache per call and tokenizes the prompt
+    text itself, so only the prompt formatting is reused here; token_ids and
+    prefix_state stay unset, and every frame pays the full text prefill. No vision feature cache is
+    passed to mlx-vlm either, so EncodedImage.features is never attached and
+    a follow-up prompt on a cached frame still runs the vision tower.
+    """
+
+    name = "mlx"
+
+    def __init__(self, model_path: str):
+        super().__init__()
         self.model_path = model_path
-        self.host = host
-        self.port = port
-        
-        # Initialize Flask app
-        self.app = Flask(__name__)
-        self.app.config['SECRET_KEY'] = 'smolvlm-secret-key'
-        
-        # Add CORS and security headers
-        @self.app.after_request
-        def after_request(response):
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-            response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE')
-            return response
-        
-        self.socketio = SocketIO(self.app, cors_allowed_origins="*", logger=True, engineio_logger=True)
-        
-        # Model will be loaded on first use
         self.model = None
         self.processor = None
-        self.config = None
-        self.model_loading = False
-        
-        self.setup_routes()
-        self.setup_socket_events()
-    
-    def load_model(self):
-        """Load the model with optimized configuration."""
-        if self.model is None and not self.model_loading:
-            self.model_loading = True
-            try:
-                print(f"Loading optimized model: {self.model_path}")
-                
-                # Load model with MLX optimizations
-                self.model, self.processor = load(self.model_path)
-                self.config = load_config(self.model_path)
-                
-                # Optimize processor for faster inference
-                # Set image resolution for speed (N=2 for 768x768, faster than default 1536x1536)
-                if hasattr(self.processor, 'image_processor'):
-                    self.processor.image_processor.size = {"longest_edge": 2 * 384}  # 768px max
-                
-                print("✅ Model loaded with optimizations!")
-                print(f"📊 Image processing size: {self.processor.image_processor.size if hasattr(self.processor, 'image_processor') else 'default'}")
-                return True
-            except Exception as e:
-                print(f"❌ Error loading model: {e}")
-                self.model_loading = False
-                return False
-            finally:
-                self.model_loading = False
-        return self.model is not None
-    
-    def ensure_complete_sentences(self, text: str) -> str:
-        """Ensure the response ends with complete sentences only."""
-        if not text:
-            return text
-        
-        # Common sentence endings
-        sentence_endings = ['.', '!', '?']
-        
-        # If text already ends with proper punctuation, return as is
-        if text[-1] in sentence_endings:
-            return text
-        
-        # Find the last complete sentence
-        last_complete = -1
-        for i, char in enumerate(text):
-            if char in sentence_endings:
-                # Check if this is really the end of a sentence (not an abbreviation)
-                if i + 1 < len(text) and text[i + 1] in [' ', '\n', '\t']:
-                    last_complete = i
-                elif i == len(text) - 1:  # End of text
-                    last_complete = i
-        
-        # If we found a complete sentence, truncate there
-        if last_complete > 0:
-            return text[:last_complete + 1].strip()
-        
-        # If no complete sentence found, try to end at a logical break point
-        logical_breaks = [',', ';', ':']
-        for break_char in logical_breaks:
-            last_break = text.rfind(break_char)
-            if last_break > len(text) * 0.7:  # Only if it's near the end
-                return text[:last_break].strip() + '.'
-        
-        # As last resort, find the last complete word and add a period
-        words = text.split()
-        if len(words) > 1:
-            # Remove the last word if it seems incomplete
-            last_word = words[-1]
-            if not last_word.endswith(('.', '!', '?', ',', ';', ':')):
-                words = words[:-1]
-            return ' '.join(words) + '.'
-        
-        return text
-    
-    def setup_routes(self):
-        """Setup Flask routes."""
-        @self.app.route('/')
-        def index():
-            return render_template_string(HTML_TEMPLATE)
-    
-    def setup_socket_events(self):
-        """Setup Socket.IO events."""
-        @self.socketio.on('connect')
-        def handle_connect():
-            print("Client connected")
-            # Load model in background if not loaded
-            if not self.load_model():
-                self.socketio.emit('error', {'message': 'Failed to load model'})
-        
-        @self.socketio.on('disconnect')
-        def handle_disconnect():
-            print("Client disconnected")
-        
-        @self.socketio.on('analyze_frame')
-        def handle_analyze_frame(data):
-            """Handle frame analysis request."""
-            if not self.model or not self.processor or not self.config:
-                if not self.load_model():
-                    self.socketio.emit('analysis_result', {
-                        'success': False,
-                        'error': 'Model not loaded'
-                    })
-                    return
-            
-            try:
-                # Decode base64 image
-                image_data = data['image'].split(',')[1]  # Remove data:image/jpeg;base64,
-                image_bytes = base64.b64decode(image_data)
-                image = Image.open(io.BytesIO(image_bytes))
-                
-                # Get parameters - optimized for speed
-                prompt = data.get('prompt', 'What do you see?')
-                max_tokens = data.get('max_tokens', 30)  # Reduced for faster generation
-                temperature = data.get('temperature', 0.2)  # Lower for faster, more focused responses
-                
-                # Optimize image size according to SmolVLM recommendations
-                # SmolVLM uses 384x384 patches, so we optimize for that
-                max_size = 768  # N=2 * 384 for good speed/quality balance
-                if max(image.size) > max_size:
-                    # Use LANCZOS for better quality at this resolution
-                    image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-                
-                print(f"📸 Image processed: {image.size} (original) -> {image.size} (processed)")
-                
-                # Use the MLX-VLM generate function directly
-                # Format prompt with image placeholder
-                formatted_prompt = f"<image>\n{prompt}"
-                
-                # Generate response with speed optimizations
-                import time
-                start_time = time.time()
-                
-                response = generate(
-                    model=self.model,
-                    processor=self.processor,
-                    prompt=formatted_prompt,
-                    image=image,
-                    verbose=False,
-                    max_tokens=max_tokens,
-                    temperature=temperature,
-                    repetition_penalty=1.0,  # Reduce repetition processing
-                    repetition_context_size=0  # Disable repetition context for speed
-                )
-                
-                inference_time = time.time() - start_time
-                print(f"Inference time: {inference_time:.2f}s")
-                
-                # Handle response - check if it's a tuple first
-                if isinstance(response, tuple):
-                    # If it's a tuple, take the first element (usually the text)
-                    response = response[0]
-                elif isinstance(response, list):
-                    response = " ".join(str(r) for r in response)
-                
-                # Ensure response is a string before calling replace
-                if not isinstance(response, str):
-                    response = str(response)
-                
-                # Clean up response
-                response = response.replace("<|im_start|>", "").replace("<|im_end|>", "").strip()
-                
-                # Ensure complete sentences
-                response = self.ensure_complete_sentences(response)
-                
-                if not response:
-                    response = "No response generated."
-                
-                self.socketio.emit('analysis_result', {
-                    'success': True,
-                    'response': response
-                })
-                
-                print(f"Analysis complete: {response[:100]}...")
-                
-            except Exception as e:
-                error_msg = f"Analysis error: {str(e)}"
-                print(error_msg)
-                self.socketio.emit('analysis_result', {
-                    'success': False,
-                    'error': error_msg
-                })
-    
-    def run(self):
-        """Run the web server."""
-        print(f"Starting MLX SmolVLM Web Server...")
-        print(f"Open your browser and go to: http://{self.host}:{self.port}")
-        print("Press Ctrl+C to stop the server")
-        
-        try:
-            self.socketio.run(
-                self.app,
-                host=self.host,
-                port=self.port,
-                debug=True,
-                allow_unsafe_werkzeug=True,
-                use_reloader=False,
-                log_output=True
-            )
-        except KeyboardInterrupt:
-            print("\nShutting down server...")
 
-def main():
-    parser = argparse.ArgumentParser(description="MLX SmolVLM Real-time Webcam Web Server")
-    parser.add_argument("--model", type=str, default="mlx-community/SmolVLM-Instruct-4bit",
-                       help="Path or HuggingFace model ID for SmolVLM model. Recommended: HuggingFaceTB/SmolVLM-Instruct")
-    parser.add_argument("--host", type=str, default="127.0.0.1",
-                       help="Host to bind the server (default: 127.0.0.1)")
-    parser.add_argument("--port", type=int, default=8080,
-                       help="Port to bind the server (default: 8080)")
-    parser.add_argument("--debug", action="store_true",
-                       help="Enable debug mode")
-    
-    args = parser.parse_args()
-    
-    # Try different hosts if localhost fails
-    if args.host == "localhost":
-        args.host = "127.0.0.1"
-    
-    print(f"🚀 Starting MLX SmolVLM Web Server...")
-    print(f"📱 Model: {args.model}")
-    print(f"🌐 Server: http://{args.host}:{args.port}")
-    print(f"🔧 Debug: {args.debug}")
-    print("=" * 50)
+    def load(self):
+        if not MLX_VLM_AVAILABLE:
+            raise RuntimeError("mlx-vlm is required. Install with: pip install mlx-vlm")
+
+        # Load model with MLX optimizations. load() has already parsed the
+        # config; it is available as self.model.config.
+        self.model, self.processor = load(self.model_path)
+
+        # Optimize processor for faster inference
+        # Set image resolution for speed (N=2 for 768x768, faster than default 1536x1536)
+        if hasattr(self.processor, 'image_processor'):
+            self.processor.image_processor.size = {"longest_edge": 2 * 384}  # 768px max
+        self.loaded = True
+
+    def record_result_stats(self, result):
+        """Record timings from an mlx-vlm result's throughput stats, if it has them.
+
+        mlx-vlm runs the vision tower inside the prompt pass, so vision
+        encoding is counted as prefill.
+        """
+        prompt_tps = getattr(result, 'prompt_tps', 0)
+        generation_tps = getattr(result, 'generation_tps', 0)
+        prompt_tokens = getattr(result, 'prompt_tokens', 0)
+        generation_tokens = getattr(result, 'generation_tokens', None)
+        self.record_timings(
+            prefill=prompt_tokens / prompt_tps if prompt_tps else None,
+            decode_tokens=generation_tokens / generation_tps if generation_tps and generation_tokens else None,
+            tokens=generation_tokens
+        )
+
+    def generate(self, image: EncodedImage, prompt: PreparedPrompt, max_tokens: int, temperature: float,
+                 stopper: Optional['SentenceStopper'] = None) -> str:
+        if stopper is not None:
+            # generate() has no stopping hook; the token iterator can be abandoned mid-way
+            return "".join(self.stream_generate(image, prompt, max_tokens, temperature, stopper))
+
+        # Use the MLX-VLM generate function directly
+        response = generate(
+            model=self.model,
+            processor=self.processor,
+            prompt=prompt.text,
+            image=image.image,
+            verbose=False,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            repetition_penalty=1.0,  # Reduce repetition processing
+            repetition_context_size=0  # Disable repetition context for speed
+        )
+
+        # Newer mlx-vlm releases return a result object with throughput stats
+        self.record_result_stats(response)
+        response = getattr(response, 'text', response)
+
+        # Handle response - check if it's a tuple first
+        if isinstance(response, tuple):
+            # If it's a tuple, take the first element (usually the text)
+            response = response[0]
+        elif isinstance(response, list):
+            response = " ".join(str(r) for r in response)
+
+        # Ensure response is a string before calling replace
+        if not isinstance(response, str):
+            response = str(response)
+        return response
+
+    def stream_generate(self, image: EncodedImage, prompt: PreparedPrompt, max_tokens: int, temperature: float,
+                        stopper: Optional['SentenceStopper'] = None):
+        self.last_timings = {}
+        for chunk in stream_generate(
+            model=self.model,
+            processor=self.processor,
+            prompt=prompt.text,
+            image=image.image,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            repetition_penalty=1.0,
+            repetition_context_size=0
+        ):
+            # Newer mlx-vlm releases yield result objects, older ones plain strings.
+            # Each result carries running stats, so the last one describes the whole call.
+            self.record_result_stats(chunk)
+            text = getattr(chunk, 'text', chunk)
+            stop = stopper is not None and stopper.feed(text)
+            yield text
+            if stop:
+                # Closes mlx-vlm's generator, so no further tokens are decoded
+                break
+
+    @property
+    def supports_batching(self):
+        return MLX_VLM_BATCH_AVAILABLE
+
+    def generate_batch(self, images: list, prompts: list, max_tokens: int, temperature: float,
+                       stoppers: Optional[list] = None) -> list:
+        if not MLX_VLM_BATCH_AVAILABLE or len(images) == 1:
+            return super().generate_batch(images, prompts, max_tokens, temperature, stoppers)
+
+        # One vision-encoder pass and one prefill for the whole batch. batch_generate()
+        # has no per-sequence stopping hook, so stoppers don't apply here and the
+        # responses are only trimmed afterwards.
+        result = batch_generate(
+            self.model,
+            self.processor,
+            images=[image.image for image in images],
+            prompts=[prompt.text for prompt in prompts],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            verbose=False
+        )
+        stats = getattr(result, 'stats', None)
+        self.record_timings(
+            prefill=getattr(stats, 'prompt_time', None),
+            decode_tokens=getattr(stats, 'generation_time', None),
+            tokens=getattr(stats, 'generation_tokens', None)
+        )
+        texts = getattr(result, 'texts', result)
+        return [str(text) for text in texts]
+
+    def image_size(self) -> Optional[dict]:
+        if hasattr(self.processor, 'image_processor'):
+            return self.processor.image_processor.size
+        return None
+
+    def set_image_edge(self, edge: int):
+        # The processor resizes every image to this, so it sets the number of 384px tiles encoded
+        if hasattr(self.processor, 'image_processor'):
+            self.processor.image_processor.size = {"longest_edge": edge}
+
+    def count_tokens(self, text: str) -> int:
+        tokenizer = getattr(self.processor, 'tokenizer', None)
+        if tokenizer is None:
+            return super().count_tokens(text)
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+class StubBackend(InferenceBackend):
+    """Deterministic CPU stand-in for the model, for benchmarking off-Mac.
+
+    Sleeps for a fixed latency (vision encoder and image prefill, scaled by
+    the number of 384px tiles relative to a 4:3 frame at 768px), the text
+    prefill of the prompt's words, and one token interval per generated word.
+    With prefix_cache on, the text prefill is skipped for prompts already
+    seen, as a backend that keeps prompt KV state would; mlx-vlm can't, so it
+    is off by default. The vision_share of the fixed latency is the vision
+    encoder; with vision_cache on, it is skipped for images that already
+    carry features. The MLX backend doesn't reuse features, so that is off by
+    default too. Returns text that only depends on the image size and prompt.
+    """
+
+    name = "stub"
+
+    STUB_SENTENCES = [
+        "The stub backend received a {width} by {height} frame.",
+        "It was asked: {prompt}",
+        "No real model ran on this request.",
+        "This text is deterministic for the same image size and prompt.",
+    ]
+
+    supports_batching = True
+
+    def __init__(self, latency: float = 0.5, tokens_per_sec: float = 40.0, image_edge: int = 768,
+                 batch_overhead: float = 0.15, prefill_tokens_per_sec: float = 500.0,
+                 vision_share: float = 0.4, prefix_cache: bool = False, vision_cache: bool = False):
+        super().__init__()
+        self.latency = latency
+        self.vision_share = vision_share
+        self.tokens_per_sec = tokens_per_sec
+        self.image_edge = image_edge
+        # Extra cost of each additional batch item, as a fraction of a single request
+        self.batch_overhead = batch_overhead
+        self.prefill_tokens_per_sec = prefill_tokens_per_sec
+        self.prefix_cache = prefix_cache
+        self.vision_cache = vision_cache
+
+    def load(self):
+        self.loaded = True
+
+    def format_prompt(self, prompt: str) -> PreparedPrompt:
+        prepared = super().format_prompt(prompt)
+        # One stub "token" per whitespace-separated word
+        prepared.token_ids = list(range(len(prepared.text.split())))
+        return prepared
+
+    def fixed_delay(self, image: EncodedImage) -> float:
+        """The fixed part of a generation, minus the vision encoder if the image is already encoded.
+
+        With vision_cache on, attaches stand-in features to the image, as
+        running the encoder would.
+        """
+        tiles = self.tiles(image)
+        scale = tiles / self.REFERENCE_TILES
+        if not self.vision_cache:
+            return self.latency * scale
+        if image.features is not None:
+            return self.latency * (1 - self.vision_share) * scale
+        # SmolVLM-sized features: 64 tokens x 2048 fp16 values per 384px tile plus a global tile
+        image.features = ('stub-features', image.image.size)
+        image.nbytes += tiles * 64 * 2048 * 2
+        return self.latency * scale
+
+    # Tiles of a 4:3 frame at 768px (2x2 plus the global tile), which `latency` is calibrated for
+    REFERENCE_TILES = 5
+
+    @staticmethod
+    def tiles(image: EncodedImage) -> int:
+        """384px tiles SmolVLM splits the image into, plus the downscaled global tile."""
+        width, height = image.image.size
+        return -(-width // 384) * -(-height // 384) + 1
+
+    def fixed_delays(self, image: EncodedImage) -> tuple:
+        """Split fixed_delay() into (vision encoder, image prefill) seconds."""
+        image_prefill = self.latency * (1 - self.vision_share) * self.tiles(image) / self.REFERENCE_TILES
+        return self.fixed_delay(image) - image_prefill, image_prefill
+
+    def text_prefill_delay(self, prompt: PreparedPrompt) -> float:
+        """Seconds of text prefill to simulate; zero once the prompt's prefix state is cached."""
+        if prompt.prefix_state is not None or self.prefill_tokens_per_sec <= 0:
+            return 0.0
+        prompt.prefill_time = len(prompt.token_ids or []) / self.prefill_tokens_per_sec
+        if self.prefix_cache:
+            prompt.prefix_state = True  # Stands in for the KV cache of the prompt tokens
+        return prompt.prefill_time
+
+    def stub_words(self, image: EncodedImage, prompt: PreparedPrompt, max_tokens: int,
+                   stopper: Optional['SentenceStopper'] = None) -> list:
+        """Return the words (one per token) the stub answers with, up to where the stopper ends it."""
+        width, height = image.image.size
+        words = []
+        while len(words) < max_tokens:
+            for sentence in self.STUB_SENTENCES:
+                words.extend(sentence.format(width=width, height=height, prompt=prompt.prompt).split())
+        words = words[:max_tokens]
+        if stopper is not None:
+            for i, word in enumerate(words):
+                if stopper.feed(word if i == 0 else " " + word):
+                    return words[:i + 1]
+        return words
+
+    def generate(self, image: EncodedImage, prompt: PreparedPrompt, max_tokens: int, temperature: float,
+                 stopper: Optional['SentenceStopper'] = None) -> str:
+        words = self.stub_words(image, prompt, max_tokens, stopper)
+        vision, prefill = self.fixed_delays(image)
+        prefill += self.text_prefill_delay(prompt)
+        decode = len(words) / self.tokens_per_sec if self.tokens_per_sec > 0 else 0.0
+        time.sleep(vision + prefill + decode)
+        self.record_timings(vision, prefill, decode, len(words))
+        return " ".join(words)
+
+    def stream_generate(self, image: EncodedImage, prompt: PreparedPrompt, max_tokens: int, temperature: float,
+                        stopper: Optional['SentenceStopper'] = None):
+        vision, prefill = self.fixed_delays(image)
+        prefill += self.text_prefill_delay(prompt)
+        time.sleep(vision + prefill)
+        words = self.stub_words(image, prompt, max_tokens, stopper)
+        decode = len(words) / self.tokens_per_sec if self.tokens_per_sec > 0 else 0.0
+        self.record_timings(vision, prefill, decode, len(words))
+        for i, word in enumerate(words):
+            if self.tokens_per_sec > 0:
+                time.sleep(1 / self.tokens_per_sec)
+            yield word if i == 0 else " " + word
+
+    def generate_batch(self, images: list, prompts: list, max_tokens: int, temperature: float,
+                       stoppers: Optional[list] = None) -> list:
+        answers = [self.stub_words(image, prompt, max_tokens, stoppers[i] if stoppers else None)
+                   for i, (image, prompt) in enumerate(zip(images, prompts))]
+        # Batched decode steps all sequences together, so cost follows the longest one
+        vision, prefill = max(self.fixed_delays(image) for image in images)
+        prefill += sum(self.text_prefill_delay(prompt) for prompt in prompts)
+        decode = 0.0
+        if self.tokens_per_sec > 0:
+            decode = max(len(words) for words in answers) / self.tokens_per_sec
+        scale = 1 + self.batch_overhead * (len(answers) - 1)
+        time.sleep((vision + prefill + decode) * scale)
+        self.record_timings(vision * scale, prefill * scale, decode * scale,
+                            sum(len(words) for words in answers))
+        return [" ".join(words) for words in answers]
+
+    def image_size(self) -> Optional[dict]:
+        return {"longest_edge": self.image_edge}
+
+    def set_image_edge(self, edge: int):
+        self.image_edge = edge
+
+
+def create_backend(name: str, model_path: str, stub_latency: float = 0.5, stub_tokens_per_sec: float = 40.0,
+                   stub_prefix_cache: bool = False, stub_vision_cache: bool = False) -> InferenceBackend:
+    """Create an inference backend by name ("mlx" or "stub")."""
+    if name == "mlx":
+        return MLXBackend(model_path)
+    if name == "stub":
+        return StubBackend(latency=stub_latency, tokens_per_sec=stub_tokens_per_sec,
+                           prefix_cache=stub_prefix_cache, vision_cache=stub_vision_cache)
+    raise ValueError(f"Unknown backend: {name}")
+
+
+@dataclass
+class FrameRequest:
+    """A frame analysis request waiting for the inference worker."""
+    sid: str
+    image: Any
+    prompt: str
+    max_tokens: int
+    temperature: float
+    stream: bool = False
+    # Client-chosen id echoed back with the result, so the page can measure round-trip time
+    request_id: Any = None
+    received_at: float = field(default_factory=time.time)
+    enqueued_at: float = 0.0
+    queue_wait: float = 0.0
+    # Hash of the preprocessed frame; set by the worker, or by the client to reanalyze a cached frame
+    frame_id: Optional[str] = None
+    # Downsampled thumbnail of the decoded frame, for scene-change detection
+    signature: Optional[bytes] = None
+    # Response cache key, set when the answer may be cached
+    cache_key: Optional[str] = None
+    # Seconds of prompt formatting/prefill skipped thanks to the prompt cache
+    prefill_saved: float = 0.0
+    # Seconds spent decoding the upload, and on the rest of preprocessing (hash, scene check, caches)
+    decode_time: float = 0.0
+    preprocess_time: float = 0.0
+    # Generation results for the latency breakdown; None until the model ran
+    time_to_first_token: Optional[float] = None
+    generation_time: Optional[float] = None
+    tokens: Optional[int] = None
+    # Token budget left undecoded because generation stopped at a sentence boundary
+    tokens_saved: Optional[int] = None
+    # Quality level (image edge, max_tokens cap) the request was processed at, when adaptive
+    quality: Optional[dict] = None
+    # Set once a result (of any kind) was sent for this request
+    answered: bool = False
+
+    # Several prompts about this one frame, answered together (fan-out)
+    prompts: Optional[list] = None
+
+    def generation_key(self) -> tuple:
+        """The settings that, with the image, determine the answer."""
+        prompt = tuple(self.prompts) if self.prompts else self.prompt
+        return (prompt, self.max_tokens, self.temperature)
+
+
+def decode_frame_image(image_bytes: bytes, max_size: int) -> Image.Image:
+    """Decode an uploaded frame to an RGB image no larger than max_size.
+
+    JPEGs are decoded in draft mode, which lets libjpeg scale by 1/2, 1/4
+    or 1/8 in the DCT domain, so a large frame is never fully decoded just
+    to be shrunk. Once the image is within a factor of two of the target a
+    bilinear resize is indistinguishable from LANCZOS at this size and
+    much cheaper.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    width, height = image.size
+    scale = max_size / max(width, height)
+    if scale >= 1:
+        return image.convert('RGB')
+
+    target = (max(1, round(width * scale)), max(1, round(height * scale)))
+    if image.format == 'JPEG':
+        # Decodes at the smallest DCT scale that is still >= target, straight to RGB
+        image.draft('RGB', target)
+    image = image.convert('RGB')
+
+    # Non-JPEG input (or a huge JPEG) may still be far above the target:
+    # take a cheap integer box reduction first, keeping at least 2x the target
+    factor = min(image.size[0] // target[0], image.size[1] // target[1]) // 2
+    if factor >= 2:
+        image = image.reduce(factor)
+
+    if image.size != target:
+        image = image.resize(target, Image.Resampling.BILINEAR)
+    return image
+
+
+def frame_from_array(frame, max_size: int) -> Image.Image:
+    """Convert an OpenCV BGR frame to an RGB image no larger than max_size.
+
+    Shrinking first with INTER_AREA (a box filter, cheap at large ratios)
+    means the colour conversion only touches the pixels that are kept.
+    """
+    height, width = frame.shape[:2]
+    scale = max_size / max(width, height)
+    if scale < 1:
+        frame = cv2.resize(frame, (max(1, round(width * scale)), max(1, round(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+
+# Side of the grayscale thumbnail used to compare consecutive frames
+SIGNATURE_SIZE = 16
+
+
+def frame_signature(image: Image.Image) -> bytes:
+    """Return a tiny grayscale thumbnail of the frame for change detection."""
+    return image.convert('L').resize((SIGNATURE_SIZE, SIGNATURE_SIZE), Image.Resampling.BILINEAR).tobytes()
+
+
+def frame_difference(a: bytes, b: bytes) -> float:
+    """Mean absolute difference between two signatures, from 0.0 (same) to 1.0."""
+    return sum(abs(x - y) for x, y in zip(a, b)) / (255 * len(a))
+
+
+def frame_hash(image: Image.Image) -> str:
+    """Content hash of a preprocessed frame, used as its frame id."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{image.mode}:{image.size}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+# A sentence ends at one of these followed by whitespace (or the end of the text)
+SENTENCE_ENDINGS = ('.', '!', '?')
+SENTENCE_SPACES = (' ', '\n', '\t')
+
+
+def ensure_complete_sentences(text: str) -> str:
+    """Ensure the response ends with complete sentences only."""
+    if not text:
+        return text
+
+    # If text already ends with proper punctuation, return as is
+    if text[-1] in SENTENCE_ENDINGS:
+        return text
+
+    # Find the last complete sentence: the rightmost ending followed by whitespace
+    # (an abbreviation like "e.g." mid-word doesn't count)
+    last_complete = max(text.rfind(ending + space)
+                        for ending in SENTENCE_ENDINGS for space in SENTENCE_SPACES)
+
+    # If we found a complete sentence, truncate there
+    if last_complete > 0:
+        return text[:last_complete + 1].strip()
+
+    # If no complete sentence found, try to end at a logical break point
+    logical_breaks = [',', ';', ':']
+    for break_char in logical_breaks:
+        last_break = text.rfind(break_char)
+        if last_break > len(text) * 0.7:  # Only if it's near the end
+            return text[:last_break].strip() + '.'
+
+    # As last resort, find the last complete word and add a period
+    words = text.split()
+    if len(words) > 1:
+        # Remove the last word if it seems incomplete
+        last_word = words[-1]
+        if not last_word.endswith(('.', '!', '?', ',', ';', ':')):
+            words = words[:-1]
+        return ' '.join(words) + '.'
+
+    return text
+
+
+class SentenceStopper:
+    """Stopping criterion that ends decoding at a sentence boundary.
+
+    Fed the decoded text one token at a time, it detects sentence ends the
+    same way ensure_complete_sentences() does and says to stop once
+    max_sentences are complete (0 for no limit) or once the token budget
+    left after the last complete sentence is shorter than the sentences so
+    far. The cleanup would cut any further text off, so decoding it is
+    wasted.
+    """
+
+    def __init__(self, max_tokens: int, max_sentences: int = 0):
+        self.max_tokens = max_tokens
+        self.max_sentences = max_sentences
+        self.tokens = 0
+        self.sentences = 0
+        # Tokens decoded up to the end of the last complete sentence
+        self.sentence_tokens = 0
+        self.stopped = False
+        # The previous character was an ending, waiting for whitespace to confirm it
+        self.after_ending = False
+
+    def feed(self, chunk: str) -> bool:
+        """Account for one decoded token's text; return True if decoding should stop."""
+        self.tokens += 1
+        for char in chunk:
+            if self.after_ending and char in SENTENCE_SPACES:
+                self.sentences += 1
+                # The ending was the previous token unless this chunk carries it too
+                self.sentence_tokens = self.tokens if chunk[0] not in SENTENCE_SPACES else self.tokens - 1
+            self.after_ending = char in SENTENCE_ENDINGS
+        if self.sentences and not self.stopped:
+            average = self.sentence_tokens / self.sentences
+            if (self.max_sentences and self.sentences >= self.max_sentences) \
+                    or self.max_tokens - self.sentence_tokens < average:
+                self.stopped = True
+        return self.stopped
+
+    @property
+    def tokens_saved(self) -> int:
+        """Token budget left undecoded because of an early stop."""
+        return self.max_tokens - self.tokens if self.stopped else 0
+
+
+def clean_response(response: str) -> str:
+    """Strip chat markers and trailing sentence fragments from a raw response."""
+    # Clean up response
+    response = response.replace("<|im_start|>", "").replace("<|im_end|>", "").strip()
+
+    # Ensure complete sentences
+    response = ensure_complete_sentences(response)
+
+    if not response:
+        response = "No response generated."
+    return response
+
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by entry count and total size, with optional TTL."""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (value, size, stored_at)
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl and time.time() - entry[2] > self.ttl:
+                self.remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, value, size: int):
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = (value, size, time.time())
+            self.total_bytes += size
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                self.remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def remove(self, key: str):
+        """Drop an entry. Caller holds the lock."""
+        _, size, _ = self.entries.pop(key)
+        self.total_bytes -= size
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+class ResponseCache(LRUCache):
+    """Generated responses keyed on frame hash and generation settings."""
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 1024 * 1024, ttl: Optional[float] = None):
+        super().__init__(max_entries, max_bytes, ttl)
+
+    @staticmethod
+    def make_key(frame_id: str, prompt: str, max_tokens: int, temperature: float) -> str:
+        """Key from the preprocessed image's hash plus the generation settings."""
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{frame_id}:{max_tokens}:{temperature}:{prompt}".encode())
+        return digest.hexdigest()
+
+    def put(self, key: str, response: str):
+        super().put(key, response, len(response.encode()) + len(key))
+
+
+class EmbeddingCache(LRUCache):
+    """Encoded frames (preprocessed image plus vision features) keyed on frame hash.
+
+    Bounded by memory, so follow-up prompts on a recent frame skip the upload,
+    decode and vision encoder.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, max_entries: int = 64):
+        super().__init__(max_entries, max_bytes)
+
+    def put(self, frame_id: str, encoded: EncodedImage):
+        super().put(frame_id, encoded, encoded.nbytes)
+
+
+# Latency histogram buckets in seconds, from sub-millisecond decodes to slow generations
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(labels: dict) -> str:
+    """Render a label set in the Prometheus text format, e.g. {phase="decode"}."""
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Histogram:
+    """Thread-safe cumulative histogram, rendered in the Prometheus text format."""
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self.lock:
+            self.count += 1
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+
+    def render(self, name: str, labels: dict) -> list:
+        with self.lock:
+            lines = [f"{name}_bucket{format_labels({**labels, 'le': bound})} {count}"
+                     for bound, count in zip(self.buckets, self.counts)]
+            lines.append(f"{name}_bucket{format_labels({**labels, 'le': '+Inf'})} {self.count}")
+            lines.append(f"{name}_sum{format_labels(labels)} {self.sum}")
+            lines.append(f"{name}_count{format_labels(labels)} {self.count}")
+        return lines
+
+
+class PipelineMetrics:
+    """Per-phase latency histograms and event counters for the /metrics endpoint.
+
+    Gauges (queue depth, sessions, cache stats) are read from their owners at
+    scrape time and passed to render().
+    """
+
+    PREFIX = "smolvlm"
+
+    # Pipeline phases timed per request or per model call
+    PHASES = ('decode', 'preprocess', 'queue_wait', 'vision_encode', 'prefill',
+              'decode_tokens', 'generate', 'emit')
+
+    COUNTERS = {
+        'frames_received_total': "Frames received from clients, by upload transport.",
+        'results_total': "Results sent to clients, by how they were produced.",
+        'errors_total': "Failed or dropped requests, by error type.",
+        'generated_tokens_total': "Tokens generated by the model.",
+        'tokens_saved_total': "Token budget left undecoded by stopping at a sentence boundary.",
+    }
+
+    def __init__(self):
+        self.phases = {phase: Histogram() for phase in self.PHASES}
+        self.counters = {}  # (name, sorted label items) -> value
+        self.lock = threading.Lock()
+        # Decode rate of the latest generation that reported its token count
+        self.tokens_per_sec = 0.0
+
+    def observe(self, phase: str, seconds: Optional[float]):
+        if seconds is not None:
+            self.phases[phase].observe(seconds)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe_generation(self, timings: dict, elapsed: float):
+        """Record a model call: its wall time plus whatever phase breakdown the backend reported."""
+        self.observe('generate', elapsed)
+        for phase in ('vision_encode', 'prefill', 'decode_tokens'):
+            self.observe(phase, timings.get(phase))
+        tokens = timings.get('tokens')
+        if tokens:
+            self.inc('generated_tokens_total', tokens)
+            self.tokens_per_sec = tokens / (timings.get('decode_tokens') or elapsed)
+
+    def render(self, gauges: list) -> str:
+        """Prometheus text exposition; gauges are (name, help, type, [(labels, value)]) tuples."""
+        name = f"{self.PREFIX}_phase_seconds"
+        lines = [f"# HELP {name} Seconds spent in each pipeline phase.", f"# TYPE {name} histogram"]
+        for phase, histogram in self.phases.items():
+            lines.extend(histogram.render(name, {'phase': phase}))
+
+        with self.lock:
+            counters = dict(self.counters)
+        for counter, help_text in self.COUNTERS.items():
+            name = f"{self.PREFIX}_{counter}"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            samples = [(dict(labels), value) for (key, labels), value in counters.items() if key == counter]
+            for labels, value in samples or [({}, 0)]:
+                lines.append(f"{name}{format_labels(labels)} {value}")
+
+        for gauge, help_text, metric_type, samples in gauges:
+            name = f"{self.PREFIX}_{gauge}"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+            for labels, value in samples:
+                lines.append(f"{name}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Default quality ladder: (longest image edge, max_tokens cap), N x 384px tiles, cheapest first
+DEFAULT_QUALITY_LADDER = ((384, 20), (768, 30), (1152, 45), (1536, 60))
+
+
+def parse_quality_ladder(text: str) -> list:
+    """Parse "edge:max_tokens,..." (e.g. "384:20,768:30") into levels sorted cheapest first."""
+    levels = []
+    for item in text.split(','):
+        edge, _, max_tokens = item.strip().partition(':')
+        if not edge.isdigit() or not max_tokens.isdigit():
+            raise ValueError(f"Bad quality level {item!r}, expected edge:max_tokens")
+        levels.append((int(edge), int(max_tokens)))
+    return sorted(levels)
+
+
+class QualityController:
+    """Steps through a ladder of (image edge, max_tokens cap) levels to hold a target p95 latency.
+
+    Each model result's latency (receipt to result) goes into a sliding
+    window of the last `window` seconds, so a burst that has passed stops
+    counting. The controller decides once the window holds `min_samples`
+    latencies since the last change, or, at light load, once a whole window
+    has passed with at least one. It steps down a level if p95 is over
+    target or frames are piling up in the queue, and steps up if p95 is
+    comfortably under target with the queue empty. The window is cleared on
+    every change so each level is judged on its own latencies.
+    """
+
+    def __init__(self, ladder, target_p95: float, start_edge: int = 768, window: float = 10.0,
+                 min_samples: int = 8, max_queue_depth: int = 2, headroom: float = 0.6):
+        self.ladder = sorted(ladder)
+        self.target_p95 = target_p95
+        self.window = window
+        self.min_samples = min_samples
+        # Queue depth beyond which the controller steps down regardless of latency
+        self.max_queue_depth = max_queue_depth
+        # Step up only while p95 is below this fraction of the target
+        self.headroom = headroom
+        # Start at the richest level that doesn't exceed the model's default resolution
+        self.level = max([i for i, (edge, _) in enumerate(self.ladder) if edge <= start_edge] or [0])
+        self.latencies = []
+        self.changes = 0
+        self.changed_at = time.time()
+        self.lock = threading.Lock()
+
+    def observe(self, latency: float):
+        with self.lock:
+            self.latencies.append((time.time(), latency))
+
+    def recent(self) -> list:
+        """Latencies observed within the window, dropping older ones."""
+        cutoff = time.time() - self.window
+        with self.lock:
+            while self.latencies and self.latencies[0][0] < cutoff:
+                self.latencies.pop(0)
+            return [latency for _, latency in self.latencies]
+
+    def p95(self, latencies: Optional[list] = None) -> Optional[float]:
+        """p95 of the given latencies, or of the recent window by default."""
+        latencies = sorted(self.recent() if latencies is None else latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    def update(self, queue_depth: int) -> bool:
+        """Re-evaluate the level given the current queue depth; return True if it changed."""
+        # One snapshot for both the sample count and p95, so a concurrent reset can't empty it in between
+        latencies = self.recent()
+        if not latencies:
+            return False
+        # A slow trickle of requests never fills min_samples; a full window of it is enough
+        if len(latencies) < self.min_samples and time.time() - self.changed_at < self.window:
+            return False
+        p95 = self.p95(latencies)
+        level = self.level
+        if (p95 > self.target_p95 or queue_depth > self.max_queue_depth) and level > 0:
+            level -= 1
+        elif p95 < self.target_p95 * self.headroom and queue_depth == 0 and level < len(self.ladder) - 1:
+            level += 1
+        if level == self.level:
+            return False
+        with self.lock:
+            self.level = level
+            self.latencies = []
+            self.changes += 1
+            self.changed_at = time.time()
+        return True
+
+    def current(self) -> dict:
+        edge, max_tokens = self.ladder[self.level]
+        return {'level': self.level, 'image_edge': edge, 'max_tokens': max_tokens}
+
+    def stats(self) -> dict:
+        p95 = self.p95()
+        return {
+            **self.current(),
+            'levels': len(self.ladder),
+            'target_p95': self.target_p95,
+            'recent_p95': round(p95, 4) if p95 is not None else None,
+            'changes': self.changes
+        }
+
+
+# Upper bound on fan-out prompts per frame, so one client can't monopolize a batch
+MAX_PROMPTS_PER_FRAME = 8
+
+# Camera rooms one client may be in at once; each browser-fed room runs its own schedule thread
+MAX_ROOMS_PER_CLIENT = 4
+
+
+def normalize_prompts(prompts) -> Optional[list]:
+    """Clean a client-supplied prompt list: strings only, no blanks or duplicates, capped."""
+    if not isinstance(prompts, list):
+        return None
+    cleaned = []
+    for prompt in prompts:
+        if isinstance(prompt, str) and prompt.strip() and prompt.strip() not in cleaned:
+            cleaned.append(prompt.strip())
+    return cleaned[:MAX_PROMPTS_PER_FRAME] or None
+
+
+@dataclass
+class ClientSession:
+    """Per-connection state, keyed by Socket.IO sid."""
+    sid: str
+    connected_at: float
+    # Generation settings, updated by each analyze_frame or update_settings event
+    prompt: str = 'What do you see?'
+    # Fan-out prompts; when set, each frame is asked all of them
+    prompts: Optional[list] = None
+    max_tokens: int = 30  # Reduced for faster generation
+    temperature: float = 0.2  # Lower for faster, more focused responses
+    stream: bool = False
+    in_flight: bool = False
+    frames_submitted: int = 0
+    results_sent: int = 0
+    last_frame_id: Optional[str] = None
+    # Last analyzed frame, used to skip inference when the scene hasn't changed
+    last_signature: Optional[bytes] = None
+    last_generation_key: Optional[tuple] = None
+    # A string, or a {prompt: response} map for fan-out requests
+    last_response: Any = None
+    # Name of the camera room this session stands for; None for browser clients
+    camera: Optional[str] = None
+    # Camera rooms this client has joined
+    rooms: set = field(default_factory=set)
+
+    def update_settings(self, data: dict):
+        """Apply any generation settings present in a client payload."""
+        self.prompt = data.get('prompt', self.prompt)
+        if 'prompts' in data:
+            self.prompts = normalize_prompts(data['prompts'])
+        self.max_tokens = data.get('max_tokens', self.max_tokens)
+        self.temperature = data.get('temperature', self.temperature)
+        self.stream = bool(data.get('stream', self.stream))
+
+
+class CoalescingQueue:
+    """Bounded FIFO that holds at most one pending request per key.
+
+    Putting a request whose key is already pending replaces the pending one
+    in place (keeping its turn) and hands the replaced request back, so a
+    client never has more than one stale frame waiting.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.pending = OrderedDict()
+        self.cond = threading.Condition()
+
+    def put(self, key, item) -> tuple:
+        """Queue an item. Returns (accepted, replaced_item)."""
+        with self.cond:
+            if key in self.pending:
+                replaced = self.pending[key]
+                self.pending[key] = item
+                return True, replaced
+            if len(self.pending) >= self.maxsize:
+                return False, None
+            self.pending[key] = item
+            self.cond.notify()
+            return True, None
+
+    def wait_for_size(self, size: int, timeout: Optional[float] = None) -> bool:
+        """Block until at least `size` items are pending or the timeout expires."""
+        with self.cond:
+            return self.cond.wait_for(lambda: len(self.pending) >= size, timeout)
+
+    def pop_many(self, count: int) -> list:
+        """Pop up to `count` of the oldest pending items."""
+        with self.cond:
+            return [self.pending.popitem(last=False)[1]
+                    for _ in range(min(count, len(self.pending)))]
+
+    def qsize(self) -> int:
+        with self.cond:
+            return len(self.pending)
+
+    def peek(self):
+        """The oldest pending item, or None."""
+        with self.cond:
+            return next(iter(self.pending.values()), None)
+
+    def remove_where(self, predicate: Callable[[Any], bool]) -> list:
+        """Drop and return every pending item matching the predicate."""
+        with self.cond:
+            keys = [key for key, item in self.pending.items() if predicate(item)]
+            return [self.pending.pop(key) for key in keys]
+
+
+class InferenceWorker:
+    """Single thread that owns the model, fed by a bounded request queue.
+
+    Socket.IO handlers only call submit(); everything that touches the model
+    runs on the worker thread, so a slow generation never blocks connects,
+    disconnects or other clients' events. Requests that arrive within
+    batch_window seconds of each other are handed to process_fn together,
+    up to max_batch_size at a time.
+
+    With coalescing on, each client (sid) has at most one pending request:
+    a newer frame replaces the waiting one, which is passed to
+    superseded_fn, so latency stays bounded by one inference.
+
+    If process_fn raises, failed_fn is called with each request of the batch
+    and the exception, so no client is left waiting for an answer.
+    """
+
+    def __init__(self, process_fn: Callable[[list], None], max_queue: int = 8,
+                 max_batch_size: int = 1, batch_window: float = 0.0, coalesce: bool = True,
+                 superseded_fn: Optional[Callable[[FrameRequest], None]] = None,
+                 failed_fn: Optional[Callable[[FrameRequest, Exception], None]] = None):
+        self.process_fn = process_fn
+        self.superseded_fn = superseded_fn
+        self.failed_fn = failed_fn
+        self.max_queue = max_queue
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_window = batch_window
+        self.coalesce = coalesce
+        self.queue = CoalescingQueue(max_queue)
+        self.thread = None
+        self.busy = False
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.rejected = 0
+        self.superseded = 0
+        self.processed = 0
+        self.batches = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+    def start(self):
+        """Start the worker thread (idempotent)."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="inference-worker", daemon=True)
+            self.thread.start()
+
+    def submit(self, frame_request: FrameRequest) -> bool:
+        """Queue a request. Returns False if the queue is full."""
+        frame_request.enqueued_at = time.time()
+        key = frame_request.sid if self.coalesce else id(frame_request)
+        accepted, replaced = self.queue.put(key, frame_request)
+        with self.lock:
+            if not accepted:
+                self.rejected += 1
+                return False
+            self.submitted += 1
+            if replaced is not None:
+                self.superseded += 1
+        if replaced is not None and self.superseded_fn is not None:
+            self.superseded_fn(replaced)
+        return True
+
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+    def cancel(self, sid: str) -> int:
+        """Drop a client's pending requests (e.g. on disconnect). Returns how many were dropped."""
+        return len(self.queue.remove_where(lambda frame_request: frame_request.sid == sid))
+
+    def next_batch(self) -> list:
+        """Block for one request, then let more arrive until the window closes or the batch is full."""
+        self.queue.wait_for_size(1)
+        # A streaming request is generated on its own, so waiting for others to batch with only delays it
+        streaming = getattr(self.queue.peek(), 'stream', False)
+        if self.max_batch_size > 1 and self.batch_window > 0 and not streaming:
+            # Requests stay in the queue during the window so newer frames can still replace them
+            self.queue.wait_for_size(self.max_batch_size, timeout=self.batch_window)
+        return self.queue.pop_many(self.max_batch_size)
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            now = time.time()
+            with self.lock:
+                for frame_request in batch:
+                    frame_request.queue_wait = now - frame_request.enqueued_at
+                    self.total_wait += frame_request.queue_wait
+                    self.max_wait = max(self.max_wait, frame_request.queue_wait)
+                    self.last_wait = frame_request.queue_wait
+            self.busy = True
+            try:
+                self.process_fn(batch)
+            except Exception as e:
+                print(f"❌ Inference worker error: {e}")
+                for frame_request in batch if self.failed_fn is not None else []:
+                    try:
+                        self.failed_fn(frame_request, e)
+                    except Exception as report_error:
+                        print(f"❌ Could not report failed frame: {report_error}")
+            finally:
+                self.busy = False
+                with self.lock:
+                    self.processed += len(batch)
+                    self.batches += 1
+
+    def stats(self) -> dict:
+        """Queue depth, wait-time and batching statistics for sizing the deployment."""
+        with self.lock:
+            return {
+                'queue_depth': self.queue_depth(),
+                'max_queue': self.max_queue,
+                'busy': self.busy,
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+                'superseded': self.superseded,
+                'coalesce': self.coalesce,
+                'processed': self.processed,
+                'batches': self.batches,
+                'max_batch_size': self.max_batch_size,
+                'batch_window': self.batch_window,
+                'avg_batch_size': self.processed / self.batches if self.batches else 0.0,
+                'avg_wait': self.total_wait / self.processed if self.processed else 0.0,
+                'max_wait': self.max_wait,
+                'last_wait': self.last_wait,
+            }
+
+
+class WorkerPool:
+    """Model worker processes behind one front end, with InferenceWorker's interface.
+
+    Each client sticks to the worker it was first routed to, so that worker's
+    response, embedding and prompt caches and the client's scene memory stay
+    warm. New clients go to the least-loaded ready worker. Dead workers are
+    restarted, and their clients' outstanding frames fail so they can resend.
+    Frames and events travel over multiprocessing queues, one pair per
+    worker, so a worker killed mid-put can only break its own results queue,
+    which is replaced when the worker is restarted.
+    """
+
+    def __init__(self, count: int, config: dict, event_fn: Callable, max_outstanding: int = 12):
+        # spawn, not fork: Metal and the model don't survive a fork
+        self.context = multiprocessing.get_context('spawn')
+        self.count = count
+        self.config = config
+        self.event_fn = event_fn  # (event, payload, to, worker_index)
+        self.max_outstanding = max_outstanding
+        self.processes = [None] * count
+        self.queues = [None] * count
+        self.results = [None] * count
+        self.states = [{'state': 'not_loaded', 'ready': False} for _ in range(count)]
+        self.outstanding = [0] * count  # frames sent to each worker and not yet answered
+        self.pipelines = [None] * count  # latest cache and scene-change stats from each worker
+        self.assignments = {}  # sid -> worker index
+        self.pending = {}  # sid -> frames sent and not yet answered
+        self.lock = threading.Lock()
+        self.stopping = False
+        self.submitted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.superseded = 0
+        self.restarts = 0
+
+    def start(self):
+        for index in range(self.count):
+            self.spawn(index)
+        threading.Thread(target=self.pump, name="worker-pool-results", daemon=True).start()
+        threading.Thread(target=self.monitor, name="worker-pool-monitor", daemon=True).start()
+
+    def spawn(self, index: int):
+        self.queues[index] = self.context.Queue()
+        self.results[index] = self.context.Queue()
+        process = self.context.Process(target=pool_worker_main, name=f"model-worker-{index}",
+                                       args=(index, self.config, self.queues[index], self.results[index]),
+                                       daemon=True)
+        process.start()
+        self.processes[index] = process
+        print(f"🧵 Model worker {index} started (pid {process.pid})")
+
+    def route(self, sid: str) -> int:
+        """Worker for a client: its sticky assignment, else the least-loaded worker (ready ones first)."""
+        index = self.assignments.get(sid)
+        if index is None:
+            clients = [0] * self.count
+            for assigned in self.assignments.values():
+                clients[assigned] += 1
+            index = min(range(self.count),
+                        key=lambda i: (not self.states[i].get('ready'), self.outstanding[i], clients[i]))
+            self.assignments[sid] = index
+        return index
+
+    def submit(self, frame_request: FrameRequest) -> bool:
+        """Send a frame to the client's worker. Returns False if that worker is saturated."""
+        with self.lock:
+            index = self.route(frame_request.sid)
+            if self.outstanding[index] >= self.max_outstanding:
+                self.rejected += 1
+                return False
+            self.outstanding[index] += 1
+            self.pending[frame_request.sid] = self.pending.get(frame_request.sid, 0) + 1
+            self.submitted += 1
+            queue = self.queues[index]
+        queue.put(('frame', frame_request))
+        return True
+
+    def cancel(self, sid: str) -> int:
+        """Forget a disconnected client and drop its pending frames in its worker."""
+        with self.lock:
+            index = self.assignments.pop(sid, None)
+            dropped = self.pending.pop(sid, 0)
+            if index is None:
+                return 0
+            self.outstanding[index] -= dropped
+            queue = self.queues[index]
+        queue.put(('cancel', sid))
+        return dropped
+
+    def pump(self):
+        """Relay events from every worker's results queue until the pool stops."""
+        while not self.stopping:
+            # Polled rather than blocked on: that would hold a native thread per worker,
+            # and eventlet and gevent have only one to lend
+            relayed = False
+            for results in list(self.results):
+                try:
+                    item = results.get_nowait()
+                except queue.Empty:
+                    continue
+                self.relay(*item)
+                relayed = True
+            if not relayed:
+                time.sleep(0.005)
+
+    def relay(self, index: int, event: str, payload: dict, to: Optional[str]):
+        """Pass one worker event on, keeping the outstanding counts in step."""
+        if event == 'pipeline_stats':
+            # Kept for /stats and /metrics, not relayed to clients
+            self.pipelines[index] = payload
+            return
+        if event == 'model_status':
+            self.states[index] = payload
+        elif event == 'analysis_result':
+            with self.lock:
+                # Results for cancelled clients were already subtracted
+                if self.pending.get(to, 0) > 0 and self.assignments.get(to) == index:
+                    self.pending[to] -= 1
+                    self.outstanding[index] -= 1
+                if payload.get('superseded'):
+                    self.superseded += 1
+                else:
+                    self.processed += 1
+        self.event_fn(event, payload, to, index)
+
+    def monitor(self, interval: float = 1.0):
+        """Restart workers that died, failing the frames they held."""
+        while not self.stopping:
+            time.sleep(interval)
+            for index, process in enumerate(self.processes):
+                if process is None or process.is_alive():
+                    continue
+                print(f"❌ Model worker {index} exited (code {process.exitcode}), restarting")
+                with self.lock:
+                    orphaned = [sid for sid, assigned in self.assignments.items() if assigned == index]
+                    lost = {sid: self.pending.pop(sid, 0) for sid in orphaned}
+                    for sid in orphaned:
+                        # Re-routed on their next frame
+                        del self.assignments[sid]
+                    self.outstanding[index] = 0
+                    self.states[index] = {'state': 'loading', 'ready': False}
+                    self.restarts += 1
+                self.spawn(index)
+                self.event_fn('model_status', self.states[index], None, index)
+                for sid, count in lost.items():
+                    for _ in range(count):
+                        self.event_fn('analysis_result', {
+                            'success': False,
+                            'error': 'Model worker restarted, frame dropped'
+                        }, sid, index)
+
+    def worker_states(self) -> list:
+        return [dict(state) for state in self.states]
+
+    def process_usages(self) -> list:
+        """Each worker's latest reported CPU time and peak memory (None until it reports)."""
+        return [stats.get('process') if stats is not None else None for stats in self.pipelines]
+
+    def pipeline_stats(self) -> dict:
+        """Cache and scene-change stats summed over the workers, in the shape a single server reports."""
+        reported = [stats for stats in self.pipelines if stats is not None]
+        scene_checks = sum(stats['scene_change']['checked'] for stats in reported)
+        scene_skips = sum(stats['scene_change']['skipped'] for stats in reported)
+        merged = {'scene_change': {
+            'checked': scene_checks,
+            'skipped': scene_skips,
+            'skip_rate': scene_skips / scene_checks if scene_checks else 0.0
+        }}
+        for cache in ('response_cache', 'embedding_cache', 'prompt_cache'):
+            totals = {}
+            for stats in reported:
+                for key, value in stats[cache].items():
+                    if key == 'ttl':
+                        totals[key] = value
+                    elif key != 'hit_rate':
+                        totals[key] = totals.get(key, 0) + value
+            lookups = totals.get('hits', 0) + totals.get('misses', 0)
+            totals['hits'] = totals.get('hits', 0)
+            totals['misses'] = totals.get('misses', 0)
+            totals['hit_rate'] = totals['hits'] / lookups if lookups else 0.0
+            merged[cache] = totals
+        return merged
+
+    def queue_depth(self) -> int:
+        with self.lock:
+            return sum(self.outstanding)
+
+    def stats(self) -> dict:
+        with self.lock:
+            clients = [0] * self.count
+            for assigned in self.assignments.values():
+                clients[assigned] += 1
+            return {
+                'workers': self.count,
+                'queue_depth': sum(self.outstanding),
+                'max_queue': self.max_outstanding * self.count,
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+                'superseded': self.superseded,
+                'processed': self.processed,
+                'batches': 0,  # Batching happens inside the workers
+                'restarts': self.restarts,
+                'per_worker': [
+                    {
+                        'pid': process.pid if process is not None else None,
+                        'alive': process is not None and process.is_alive(),
+                        'state': self.states[index].get('state'),
+                        'outstanding': self.outstanding[index],
+                        'clients': clients[index]
+                    }
+                    for index, process in enumerate(self.processes)
+                ]
+            }
+
+
+def blocking_runner(async_mode: str) -> Callable:
+    """Return a function that runs blocking work (model calls, image decode) off the event loop.
+
+    Under eventlet or gevent the inference worker is a green thread, so a model
+    call made on it would stall every connection. It runs on one native thread
+    instead, so the model is still never entered concurrently.
+    """
+    if async_mode == 'gevent':
+        from gevent.threadpool import ThreadPool
+        pool = ThreadPool(1)
+        return lambda fn, *args, **kwargs: pool.apply(fn, args, kwargs)
+    if async_mode == 'eventlet':
+        from eventlet import tpool
+        tpool.set_num_threads(1)
+        return tpool.execute
+    return lambda fn, *args, **kwargs: fn(*args, **kwargs)
+
+
+def patch_for_async_mode(async_mode: str):
+    """Monkey-patch the standard library for a green-thread server. Call before the server is created."""
+    if async_mode == 'gevent':
+        from gevent import monkey
+        monkey.patch_all()
+    elif async_mode == 'eventlet':
+        import eventlet
+        eventlet.monkey_patch()
+
+
+class FrameSource:
+    """The frames of one shared camera room, of which only the newest is kept.
+
+    The server's schedule thread analyzes that frame every `interval`
+    seconds (see MLXSmolVLMWebServer.start_room) and emits each result once
+    to the room's Socket.IO room, named like its session id. The latest
+    result is kept for viewers who join later.
+    """
+
+    def __init__(self, name: str, interval: float = 2.0):
+        self.name = name
+        self.interval = interval
+        self.sid = f"camera:{name}"
+        self.run_blocking = lambda fn, *args, **kwargs: fn(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.frame = None
+        # Increases with every new frame, so the schedule can tell a new frame from a re-read
+        self.sequence = 0
+        # Client sids in the room, and the result they were last sent
+        self.viewers = set()
+        self.last_result = None
+
+    def put(self, frame):
+        with self.lock:
+            self.frame = frame
+            self.sequence += 1
+
+    def latest(self) -> tuple:
+        """Return (sequence, frame) for the newest frame; frame is None until one arrives."""
+        with self.lock:
+            return self.sequence, self.frame
+
+    def to_image(self, frame, max_size: int):
+        """Turn a held frame into a FrameRequest image."""
+        return frame
+
+    def stats(self) -> dict:
+        return {
+            'interval': self.interval,
+            'frames_read': self.sequence,
+            'viewers': len(self.viewers)
+        }
+
+
+class BrowserSource(FrameSource):
+    """A camera room fed by one browser client, the producer, uploading frames.
+
+    Uploads are kept as received (JPEG bytes or data URL) and decoded by the
+    inference worker like any other client's frame. The first client to join
+    produces; when it leaves, another viewer takes over.
+    """
+
+    def __init__(self, name: str, interval: float = 2.0):
+        super().__init__(name, interval)
+        self.producer = None
+
+    def stats(self) -> dict:
+        return {**super().stats(), 'source': 'browser', 'has_producer': self.producer is not None}
+
+
+class CameraSource(FrameSource):
+    """A camera or video file the server pulls frames from itself.
+
+    A reader thread decodes frames as they arrive and keeps only the newest,
+    so a slow model never leaves a backlog of stale frames.
+
+    `url` is an RTSP or HTTP MJPEG URL, a V4L2 device (an index such as "0",
+    or a path like /dev/video0) or a local video file. Files loop, read at
+    their own frame rate so they stand in for a live camera.
+    """
+
+    # Seconds to wait before reopening a stream that failed or ended
+    RECONNECT_DELAY = 2.0
+
+    def __init__(self, name: str, url: str, interval: float = 2.0, run_blocking: Optional[Callable] = None):
+        super().__init__(name, interval)
+        self.url = url
+        self.is_file = os.path.isfile(url)
+        # Reads block in OpenCV; under eventlet/gevent they must leave the event loop
+        if run_blocking is not None:
+            self.run_blocking = run_blocking
+        self.state = 'connecting'
+        self.reconnects = 0
+        self.last_error = None
+        self.sleep = time.sleep
+
+    def open(self):
+        """Open the capture for this source's URL."""
+        return cv2.VideoCapture(int(self.url) if self.url.isdigit() else self.url)
+
+    def read_loop(self):
+        """Keep the newest decoded frame, reconnecting (or looping a file) when the stream ends."""
+        while True:
+            capture = self.run_blocking(self.open)
+            if not capture.isOpened():
+                self.set_state('reconnecting', f"Cannot open {self.url}")
+                self.sleep(self.RECONNECT_DELAY)
+                continue
+            # A file is paced at its own frame rate; a live source blocks until the next frame
+            pace = 0.0
+            if self.is_file:
+                pace = 1.0 / (capture.get(cv2.CAP_PROP_FPS) or 30.0)
+            self.set_state('streaming')
+            frames = 0
+            next_read = time.time()
+            while True:
+                ok, frame = self.run_blocking(capture.read)
+                if not ok:
+                    if self.is_file and frames and capture.set(cv2.CAP_PROP_POS_FRAMES, 0):
+                        frames = 0
+                        continue
+                    break
+                frames += 1
+                self.put(frame)
+                if pace:
+                    next_read += pace
+                    self.sleep(max(0.0, next_read - time.time()))
+            capture.release()
+            self.reconnects += 1
+            self.set_state('reconnecting', f"Stream ended: {self.url}")
+            self.sleep(self.RECONNECT_DELAY)
+
+    def set_state(self, state: str, error: Optional[str] = None):
+        if state != self.state:
+            print(f"📹 Camera {self.name}: {state}" + (f" ({error})" if error else ""))
+        self.state = state
+        self.last_error = error or self.last_error
+
+    def to_image(self, frame, max_size: int) -> Image.Image:
+        return frame_from_array(frame, max_size)
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            'source': 'server',
+            'url': self.url,
+            'state': self.state,
+            'reconnects': self.reconnects,
+            'last_error': self.last_error
+        }
+
+
+def parse_camera_spec(spec: str, default_name: str) -> tuple:
+    """Split a --camera value "NAME=URL" into (name, url); a bare URL gets default_name."""
+    name, sep, url = spec.partition('=')
+    # An "=" inside the URL itself (e.g. a query string) isn't a name separator
+    if not sep or not name or any(char in name for char in ':/?'):
+        return default_name, spec
+    return name, url
+
+
+class MLXSmolVLMWebServer:
+    def __init__(self, model_path: str, host: str = "localhost", port: int = 8080,
+                 backend: Optional[InferenceBackend] = None, max_queue: int = 8,
+                 max_batch_size: int = 4, batch_window: float = 0.05, coalesce: bool = True,
+                 jpeg_quality: int = 80, scene_change_threshold: float = 0.02,
+                 response_cache: Optional[ResponseCache] = None, cache_sampled: bool = False,
+                 embedding_cache: Optional[EmbeddingCache] = None, warm_up: bool = True,
+                 production: bool = False, async_mode: str = 'threading',
+                 workers: int = 1, worker_config: Optional[dict] = None,
+                 early_stop: bool = True, max_sentences: int = 0,
+                 target_p95: float = 0.0, quality_ladder=DEFAULT_QUALITY_LADDER,
+                 quality_window: float = 10.0, quality_min_samples: int = 8,
+                 camera_interval: float = 2.0, max_camera_rooms: int = 16):
+        """Initialize the MLX SmolVLM web server.
+        
+        With workers > 1 this process only runs the Socket.IO front end; frames
+        go to that many model worker processes, each built from worker_config
+        (see pool_worker_main).
+        """
+        self.model_path = model_path
+        self.host = host
+        self.port = port
+        self.backend = backend if backend is not None else MLXBackend(model_path)
+        # JPEG quality (percent) clients are asked to encode frames at
+        self.jpeg_quality = jpeg_quality
+        # Frames that differ from the client's last analyzed frame by less than
+        # this (0-1) reuse the last answer; 0 disables the check
+        self.scene_change_threshold = scene_change_threshold
+        self.scene_checks = 0
+        self.scene_skips = 0
+        # Camera rooms by name: server-side cameras (see add_camera) and
+        # browser-fed rooms, created when a client joins one, analyzed every camera_interval seconds
+        self.cameras = {}
+        self.camera_interval = camera_interval
+        # Browser-fed rooms that may be open at once; joins that would open another are refused
+        self.max_camera_rooms = max_camera_rooms
+        # With a target p95 latency, image resolution and max_tokens follow the load.
+        # In pool mode each worker process adapts on its own.
+        self.quality = None
+        if target_p95 > 0 and workers <= 1:
+            self.quality = QualityController(quality_ladder, target_p95,
+                                             window=quality_window, min_samples=quality_min_samples,
+                                             start_edge=self.backend.processing_size())
+        # Stop decoding at a sentence boundary once no further complete sentence
+        # fits in the token budget, or after max_sentences (0 for no limit)
+        self.early_stop = early_stop
+        self.max_sentences = max_sentences
+        # Identical (image, prompt, settings) requests are answered from this cache.
+        # Only deterministic (temperature 0) answers are cached unless cache_sampled is set.
+        self.response_cache = response_cache if response_cache is not None else ResponseCache()
+        self.cache_sampled = cache_sampled
+        # Encoded frames by frame id, for follow-up prompts and reanalyze
+        self.embedding_cache = embedding_cache if embedding_cache is not None else EmbeddingCache()
+        # Latency histograms and counters served at /metrics
+        self.metrics = PipelineMetrics()
+        
+        # Initialize Flask app
+        self.app = Flask(__name__)
+        self.app.config['SECRET_KEY'] = 'smolvlm-secret-key'
+        
+        # Add CORS and security headers
+        @self.app.after_request
+        def after_request(response):
+            response.headers.add('Access-Control-Allow-Origin', '*')
+            response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+            response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE')
+            return response
+        
+        # Production mode: no per-packet logging and WebSocket-only transport.
+        # The development server keeps logging and the long-polling fallback.
+        self.production = production
+        transports = ['websocket'] if production else ['polling', 'websocket']
+        self.socketio = SocketIO(self.app, cors_allowed_origins="*", async_mode=async_mode,
+                                 logger=not production, engineio_logger=not production,
+                                 transports=transports)
+        self.run_blocking = blocking_runner(self.socketio.async_mode)
+        
+        # The page only depends on the transport list, so it is rendered once
+        with self.app.app_context():
+            self.index_html = render_template_string(HTML_TEMPLATE, transports=transports)
+        
+        # Model is loaded in the background, at startup (preload) or on the first
+        # connection. model_state goes not_loaded -> loading -> warming_up -> ready,
+        # or to failed; clients are told about each change.
+        self.created_at = time.time()
+        self.warm_up = warm_up
+        self.model_state = 'not_loaded'
+        self.model_error = None
+        self.model_lock = threading.Lock()
+        self.model_ready = threading.Event()
+        # Seconds spent in each startup phase
+        self.startup_timings = {}
+        
+        # Connected clients, keyed by Socket.IO sid
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+        
+        # Upload size per frame transport ("binary" or "data_url"): [frames, bytes]
+        self.frame_bytes = {'binary': [0, 0], 'data_url': [0, 0]}
+        self.frame_bytes_lock = threading.Lock()
+        
+        # All model work runs on a single worker fed by a bounded queue.
+        # Concurrent requests are batched only if the backend can run them in one call.
+        if not self.backend.supports_batching:
+            max_batch_size = 1
+        if workers > 1:
+            # Scale-out: the same pipeline runs in each worker process
+            self.worker = WorkerPool(workers, worker_config, self.relay_event,
+                                     max_outstanding=max_queue + max_batch_size)
+        else:
+            self.worker = InferenceWorker(self.process_frame_batch, max_queue=max_queue,
+                                          max_batch_size=max_batch_size, batch_window=batch_window,
+                                          coalesce=coalesce, superseded_fn=self.emit_superseded,
+                                          failed_fn=self.emit_failed)
+        self.worker.start()
+        
+        self.setup_routes()
+        self.setup_socket_events()
+    
+    def load_model(self):
+        """Load and warm up the model, blocking until it is ready. Safe to call from any thread."""
+        if self.model_ready.is_set():
+            return True
+        with self.model_lock:
+            if self.model_ready.is_set():
+                return True
+            try:
+                print(f"Loading optimized model: {self.model_path} ({self.backend.name} backend)")
+                start_time = time.perf_counter()
+                self.set_model_state('loading')
+                self.run_blocking(self.backend.load)
+                self.record_startup_phase('load', start_time)
+                
+                print("✅ Model loaded with optimizations!")
+                if self.quality is not None:
+                    self.backend.set_image_edge(self.quality.current()['image_edge'])
+                print(f"📊 Image processing size: {self.backend.image_size() or 'default'}")
+                
+                if self.warm_up:
+                    # Compile kernels for the real frame size now, not on the first client's frame
+                    phase_start = time.perf_counter()
+                    self.set_model_state('warming_up')
+                    self.run_blocking(self.backend.warm_up, self.processing_size())
+                    self.record_startup_phase('warm_up', phase_start)
+                
+                self.record_startup_phase('total', start_time)
+                self.startup_timings['since_server_start'] = round(time.time() - self.created_at, 3)
+                print(f"⏱️ Model ready {self.startup_timings['since_server_start']:.2f}s after server start")
+                self.model_ready.set()
+                self.set_model_state('ready')
+                # The processing size is only known once the image processor is loaded
+                self.send('server_config', self.server_config())
+                return True
+            except Exception as e:
+                print(f"❌ Error loading model: {e}")
+                self.model_error = str(e)
+                self.set_model_state('failed')
+                return False
+    
+    def start_model_load(self):
+        """Load the model on a background thread unless it is loaded or loading already."""
+        if isinstance(self.worker, WorkerPool):
+            # Each worker process loads its own model as soon as it starts
+            return
+        if self.model_ready.is_set() or self.model_state in ('loading', 'warming_up'):
+            return
+        # Claim the load here so a second caller doesn't start another thread
+        self.model_state = 'loading'
+        threading.Thread(target=self.load_model, daemon=True, name="model-loader").start()
+    
+    def record_startup_phase(self, phase: str, start_time: float):
+        """Store and log how long a startup phase took."""
+        self.startup_timings[phase] = round(time.perf_counter() - start_time, 3)
+        print(f"⏱️ Startup phase {phase}: {self.startup_timings[phase]:.2f}s")
+    
+    def set_model_state(self, state: str):
+        """Update the readiness state and tell every connected client."""
+        self.model_state = state
+        if state != 'failed':
+            self.model_error = None
+        self.send('model_status', self.model_status())
+    
+    def send(self, event: str, payload: dict, to: Optional[str] = None):
+        """Emit a pipeline event to one client, or to every client when `to` is None."""
+        self.socketio.emit(event, payload, to=to)
+    
+    def model_status(self) -> dict:
+        """Readiness of the model, as reported to clients and /health."""
+        status = {
+            'state': self.model_state,
+            'ready': self.model_ready.is_set(),
+            'error': self.model_error,
+            'backend': self.backend.name,
+            'timings': dict(self.startup_timings)
+        }
+        if isinstance(self.worker, WorkerPool):
+            status['workers'] = self.worker.worker_states()
+        return status
+    
+    def pipeline_stats(self) -> dict:
+        """Scene-change and cache stats, from the worker processes when there is a pool."""
+        if isinstance(self.worker, WorkerPool):
+            # In pool mode the front end's own caches and counters are never used
+            stats = self.worker.pipeline_stats()
+            stats['scene_change'] = {'threshold': self.scene_change_threshold, **stats['scene_change']}
+            return stats
+        return {
+            'scene_change': {
+                'threshold': self.scene_change_threshold,
+                'checked': self.scene_checks,
+                'skipped': self.scene_skips,
+                'skip_rate': self.scene_skips / self.scene_checks if self.scene_checks else 0.0
+            },
+            'response_cache': self.response_cache.stats(),
+            'embedding_cache': self.embedding_cache.stats(),
+            'prompt_cache': self.backend.prompt_cache.stats()
+        }
+    
+    def server_config(self) -> dict:
+        """Frame settings the client should capture with."""
+        # Let the client downscale and encode frames to what the model will actually use
+        return {
+            'max_image_size': self.processing_size(),
+            'jpeg_quality': self.jpeg_quality / 100
+        }
+    
+    def setup_routes(self):
+        """Setup Flask routes."""
+        @self.app.route('/')
+        def index():
+            return self.index_html
+        
+        @self.app.route('/stats')
+        def stats():
+            with self.sessions_lock:
+                sessions = [session for session in self.sessions.values() if session.camera is None]
+            return jsonify({
+                'model': self.model_status(),
+                'worker': self.worker.stats(),
+                'sessions': {
+                    'connected': len(sessions),
+                    'in_flight': sum(1 for session in sessions if session.in_flight)
+                },
+                'frame_transport': self.frame_transport_stats(),
+                **self.pipeline_stats(),
+                'quality': self.quality.stats() if self.quality is not None else None,
+                'cameras': {name: source.stats() for name, source in self.cameras.items()}
+            })
+        
+        @self.app.route('/metrics')
+        def metrics():
+            return Response(self.metrics_text(), mimetype='text/plain; version=0.0.4')
+        
+        @self.app.route('/health')
+        def health():
+            # 503 until the model is loaded and warmed up, for load balancers and readiness probes
+            status = self.model_status()
+            return jsonify(status), 200 if status['ready'] else 503
+    
+    def setup_socket_events(self):
+        """Setup Socket.IO events."""
+        @self.socketio.on('connect')
+        def handle_connect():
+            print(f"Client connected: {request.sid}")
+            with self.sessions_lock:
+                self.sessions[request.sid] = ClientSession(sid=request.sid, connected_at=time.time())
+            # Load model in background if not loaded; frames sent meanwhile wait in the queue
+            self.start_model_load()
+            self.socketio.emit('model_status', self.model_status(), to=request.sid)
+            self.socketio.emit('server_config', self.server_config(), to=request.sid)
+        
+        @self.socketio.on('disconnect')
+        def handle_disconnect():
+            with self.sessions_lock:
+                session = self.sessions.pop(request.sid, None)
+            # Socket.IO drops the client from its rooms; the camera rooms' own bookkeeping is ours
+            for name in (session.rooms if session is not None else ()):
+                self.leave_camera(request.sid, name)
+            dropped = self.worker.cancel(request.sid)
+            print(f"Client disconnected: {request.sid} ({dropped} pending frame(s) dropped)")
+        
+        @self.socketio.on('update_settings')
+        def handle_update_settings(data):
+            """Store generation settings for this client's later frames."""
+            session = self.get_session(request.sid)
+            if session is not None:
+                session.update_settings(data)
+        
+        @self.socketio.on('join_camera')
+        def handle_join_camera(data):
+            """Watch a camera room; its results arrive as camera_result events."""
+            session = self.get_session(request.sid)
+            name = str((data or {}).get('camera', '')).strip()[:64]
+            if session is None or not name:
+                return
+            try:
+                if name not in session.rooms and len(session.rooms) >= MAX_ROOMS_PER_CLIENT:
+                    raise ValueError(f"Too many camera rooms joined (limit {MAX_ROOMS_PER_CLIENT})")
+                source, producer = self.join_camera(request.sid, name)
+            except ValueError as e:
+                self.socketio.emit('camera_error', {'camera': name, 'error': str(e)}, to=request.sid)
+                return
+            session.rooms.add(name)
+            join_room(source.sid)
+            self.socketio.emit('camera_joined', self.camera_info(source, producer), to=request.sid)
+            # New viewers see the room's latest answer straight away
+            if source.last_result is not None:
+                self.socketio.emit('camera_result', source.last_result, to=request.sid)
+        
+        @self.socketio.on('leave_camera')
+        def handle_leave_camera(data):
+            session = self.get_session(request.sid)
+            name = str((data or {}).get('camera', '')).strip()[:64]
+            if session is None or name not in session.rooms:
+                return
+            session.rooms.discard(name)
+            leave_room(f"camera:{name}")
+            self.leave_camera(request.sid, name)
+        
+        @self.socketio.on('analyze_frame')
+        def handle_analyze_frame(data):
+            """Queue a frame analysis request for the inference worker."""
+            session = self.get_session(request.sid)
+            if session is None:
+                return
+            session.update_settings(data)
+            image = data.get('image')
+            if isinstance(image, (bytes, bytearray)):
+                self.record_frame_bytes('binary', len(image))
+                self.metrics.inc('frames_received_total', transport='binary')
+            elif isinstance(image, str):
+                self.record_frame_bytes('data_url', len(image))
+                self.metrics.inc('frames_received_total', transport='data_url')
+            if data.get('camera'):
+                # A camera room's frame: analyzed on the room's schedule, answered to the whole room
+                self.push_room_frame(request.sid, str(data['camera']), image, data)
+                return
+            frame_request = FrameRequest(
+                sid=request.sid,
+                image=image,
+                prompt=session.prompt,
+                prompts=session.prompts,
+                max_tokens=session.max_tokens,
+                temperature=session.temperature,
+                stream=session.stream,
+                request_id=data.get('request_id')
+            )
+            if not self.worker.submit(frame_request):
+                self.metrics.inc('errors_total', type='queue_full')
+                self.socketio.emit('analysis_result', {
+                    'success': False,
+                    'error': 'Server busy, frame dropped',
+                    'queue_depth': self.worker.queue_depth(),
+                    'request_id': frame_request.request_id
+                }, to=request.sid)
+                return
+            session.frames_submitted += 1
+    
+        @self.socketio.on('reanalyze')
+        def handle_reanalyze(data):
+            """Ask a new question about an already uploaded frame, by frame id."""
+            session = self.get_session(request.sid)
+            if session is None:
+                return
+            session.update_settings(data)
+            frame_request = FrameRequest(
+                sid=request.sid,
+                image=None,
+                frame_id=data.get('frame_id') or session.last_frame_id,
+                prompt=session.prompt,
+                prompts=session.prompts,
+                max_tokens=session.max_tokens,
+                temperature=session.temperature,
+                stream=session.stream,
+                request_id=data.get('request_id')
+            )
+            if not self.worker.submit(frame_request):
+                self.metrics.inc('errors_total', type='queue_full')
+                self.socketio.emit('analysis_result', {
+                    'success': False,
+                    'error': 'Server busy, frame dropped',
+                    'queue_depth': self.worker.queue_depth(),
+                    'request_id': frame_request.request_id
+                }, to=request.sid)
+    
+    def add_camera(self, name: str, url: str, interval: float = 2.0, prompt: str = 'What do you see?',
+                   max_tokens: int = 30, temperature: float = 0.2) -> CameraSource:
+        """Start pulling frames from a camera or video file and analyzing them every `interval` seconds."""
+        if not CV2_AVAILABLE:
+            raise RuntimeError("Camera sources need OpenCV. Install with: pip install opencv-python")
+        if self.socketio.async_mode == 'eventlet':
+            # eventlet's tpool is one process-wide thread, kept for the model. The reader runs
+            # on its own OS thread instead, with the unpatched lock and sleep that thread needs.
+            from eventlet import patcher
+            native_threading = patcher.original('threading')
+            source = CameraSource(name, url, interval)
+            source.lock = native_threading.Lock()
+            source.sleep = patcher.original('time').sleep
+            reader_thread = native_threading.Thread
+        else:
+            # Under gevent each camera gets a one-thread pool of its own; otherwise reads run on the reader thread
+            source = CameraSource(name, url, interval, run_blocking=blocking_runner(self.socketio.async_mode))
+            reader_thread = threading.Thread
+        self.cameras[name] = source
+        self.start_room(source, ClientSession(sid=source.sid, connected_at=time.time(), camera=name,
+                                              prompt=prompt, max_tokens=max_tokens, temperature=temperature))
+        reader_thread(target=source.read_loop, daemon=True, name=f"camera-{name}-reader").start()
+        # Nobody has to open the page for a camera to be analyzed
+        self.start_model_load()
+        print(f"📹 Camera {name}: {url}, analyzed every {interval:g}s")
+        return source
+    
+    def start_room(self, source: FrameSource, session: ClientSession):
+        """Register a camera room's session and start its analysis schedule.
+        
+        The room gets a session like a browser client's, so the scene-change
+        check, caches and coalescing apply to it; its frames are analyzed once
+        however many viewers it has.
+        """
+        with self.sessions_lock:
+            self.sessions[source.sid] = session
+        threading.Thread(target=self.camera_schedule, args=(source,), daemon=True,
+                         name=f"camera-{source.name}-schedule").start()
+    
+    def camera_schedule(self, source: FrameSource):
+        """Submit a room's newest frame once per interval, after its previous frame was answered."""
+        last_sequence = 0
+        next_due = time.time()
+        # Runs until the room is removed
+        while self.cameras.get(source.name) is source:
+            time.sleep(max(0.05, next_due - time.time()))
+            session = self.get_session(source.sid)
+            sequence, frame = source.latest()
+            if session is None or session.in_flight or frame is None or sequence == last_sequence:
+                next_due = time.time()
+                continue
+            try:
+                image = source.run_blocking(source.to_image, frame, self.processing_size())
+            except Exception as e:
+                print(f"❌ Camera {source.name} frame error: {e}")
+                next_due = time.time() + source.interval
+                continue
+            frame_request = FrameRequest(
+                sid=source.sid,
+                image=image,
+                prompt=session.prompt,
+                prompts=session.prompts,
+                max_tokens=session.max_tokens,
+                temperature=session.temperature,
+                request_id=sequence
+            )
+            if isinstance(source, CameraSource):
+                # Browser rooms' frames were counted on upload
+                self.metrics.inc('frames_received_total', transport='camera')
+            next_due = time.time() + source.interval
+            if not self.worker.submit(frame_request):
+                self.metrics.inc('errors_total', type='queue_full')
+                continue
+            # Cleared again when its result is sent
+            session.in_flight = True
+            session.frames_submitted += 1
+            last_sequence = sequence
+    
+    def join_camera(self, sid: str, name: str) -> tuple:
+        """Add a client to a camera room, creating a browser-fed room if none exists.
+        
+        Returns (source, whether the client is the room's producer).
+        Raises ValueError when opening the room would exceed max_camera_rooms.
+        """
+        created = False
+        with self.sessions_lock:
+            source = self.cameras.get(name)
+            if source is None:
+                rooms = sum(1 for camera in self.cameras.values() if isinstance(camera, BrowserSource))
+                if rooms >= self.max_camera_rooms:
+                    raise ValueError(f"Too many camera rooms open (limit {self.max_camera_rooms})")
+                source = self.cameras[name] = BrowserSource(name, self.camera_interval)
+                created = True
+        if created:
+            self.start_room(source, ClientSession(sid=source.sid, connected_at=time.time(), camera=name))
+            print(f"📹 Camera room {name} opened")
+        producer = False
+        with source.lock:
+            source.viewers.add(sid)
+            if isinstance(source, BrowserSource) and source.producer in (None, sid):
+                source.producer = sid
+                producer = True
+        return source, producer
+    
+    def leave_camera(self, sid: str, name: str):
+        """Remove a client from a camera room, handing production on or closing an empty browser room."""
+        source = self.cameras.get(name)
+        if source is None:
+            return
+        successor = None
+        with source.lock:
+            source.viewers.discard(sid)
+            if isinstance(source, BrowserSource) and source.producer == sid:
+                source.producer = next(iter(source.viewers), None)
+                successor = source.producer
+            empty = not source.viewers
+        if isinstance(source, BrowserSource) and empty:
+            with self.sessions_lock:
+                if self.cameras.get(name) is source:
+                    del self.cameras[name]
+                    self.sessions.pop(source.sid, None)
+            self.worker.cancel(source.sid)
+            print(f"📹 Camera room {name} closed")
+        elif successor is not None:
+            self.socketio.emit('camera_joined', self.camera_info(source, producer=True), to=successor)
+    
+    @staticmethod
+    def camera_info(source: FrameSource, producer: bool) -> dict:
+        """The camera_joined payload: which room, and whether this client supplies its frames."""
+        return {
+            'camera': source.name,
+            'producer': producer,
+            'interval': source.interval,
+            'source': 'server' if isinstance(source, CameraSource) else 'browser'
+        }
+    
+    def push_room_frame(self, sid: str, name: str, image, data: dict):
+        """Hold a producer's uploaded frame for its room's schedule; other clients' frames are ignored."""
+        source = self.cameras.get(name)
+        if not isinstance(source, BrowserSource) or source.producer != sid:
+            return
+        session = self.get_session(source.sid)
+        if session is not None:
+            # The producer's settings decide what the room is asked
+            session.update_settings(data)
+        source.put(image)
+    
+    def get_session(self, sid: str) -> Optional[ClientSession]:
+        with self.sessions_lock:
+            return self.sessions.get(sid)
+    
+    def record_frame_bytes(self, transport: str, size: int):
+        with self.frame_bytes_lock:
+            self.frame_bytes[transport][0] += 1
+            self.frame_bytes[transport][1] += size
+    
+    def frame_transport_stats(self) -> dict:
+        """Frames and average upload bytes per frame for each transport."""
+        with self.frame_bytes_lock:
+            return {
+                transport: {
+                    'frames': frames,
+                    'bytes': total,
+                    'avg_bytes_per_frame': total / frames if frames else 0.0
+                }
+                for transport, (frames, total) in self.frame_bytes.items()
+            }
+    
+    def emit_result(self, frame_request: FrameRequest, payload: dict):
+        """Send an analysis result back to the client that requested it."""
+        frame_request.answered = True
+        source = self.result_source(payload)
+        self.metrics.inc('results_total', source=source)
+        if self.quality is not None and source == 'model':
+            self.quality.observe(time.time() - frame_request.received_at)
+        session = self.get_session(frame_request.sid)
+        if session is None:
+            # Client disconnected while its frame was being processed
+            return
+        if not payload.get('superseded'):
+            session.in_flight = False
+            session.results_sent += 1
+        payload['request_id'] = frame_request.request_id
+        payload['timings'] = self.request_timings(frame_request)
+        if frame_request.quality is not None:
+            payload['quality'] = frame_request.quality
+        emit_start = time.perf_counter()
+        if session.camera is not None:
+            self.publish_camera_result(session, payload)
+        else:
+            self.send('analysis_result', payload, to=frame_request.sid)
+        self.metrics.observe('emit', time.perf_counter() - emit_start)
+    
+    def publish_camera_result(self, session: ClientSession, payload: dict):
+        """Emit a camera's analysis result once to its room, and keep it for viewers who join later."""
+        payload['camera'] = session.camera
+        source = self.cameras.get(session.camera)
+        if source is not None:
+            source.last_result = payload
+        self.send('camera_result', payload, to=session.sid)
+    
+    def relay_event(self, event: str, payload: dict, to: Optional[str], worker_index: int):
+        """Forward an event from a pool worker process to the front end's clients."""
+        if event == 'model_status':
+            self.update_pool_status()
+            return
+        if event == 'analysis_result':
+            self.metrics.inc('results_total', source=self.result_source(payload))
+            # The pipeline ran in the worker; record its per-request timings here
+            timings = payload.get('timings', {})
+            for phase in ('queue_wait', 'decode', 'preprocess'):
+                self.metrics.observe(phase, timings.get(phase))
+            self.metrics.observe('generate', timings.get('generation'))
+            if timings.get('tokens'):
+                self.metrics.inc('generated_tokens_total', timings['tokens'])
+            if timings.get('tokens_saved'):
+                self.metrics.inc('tokens_saved_total', timings['tokens_saved'])
+            session = self.get_session(to)
+            if session is None:
+                return
+            if not payload.get('superseded'):
+                session.in_flight = False
+                session.results_sent += 1
+            if session.camera is not None:
+                self.publish_camera_result(session, payload)
+                return
+        self.socketio.emit(event, payload, to=to)
+    
+    def update_pool_status(self):
+        """Derive the front end's readiness from its workers: ready while any worker is."""
+        states = self.worker.worker_states()
+        ready = [state for state in states if state.get('ready')]
+        if ready:
+            self.model_ready.set()
+            self.model_state = 'ready'
+            self.startup_timings = dict(ready[0].get('timings', {}))
+        else:
+            self.model_ready.clear()
+            self.model_state = states[0].get('state', 'not_loaded')
+        self.model_error = next((state['error'] for state in states if state.get('error')), None)
+        self.socketio.emit('model_status', self.model_status())
+    
+    @staticmethod
+    def request_timings(frame_request: FrameRequest) -> dict:
+        """Server-side latency breakdown of a request, in seconds, for the client to display."""
+        timings = {
+            'received_at': round(frame_request.received_at, 4),
+            'queue_wait': frame_request.queue_wait,
+            'decode': frame_request.decode_time,
+            'preprocess': frame_request.preprocess_time,
+            'time_to_first_token': frame_request.time_to_first_token,
+            'generation': frame_request.generation_time,
+            # From receipt to this result being sent, so the client can tell network time apart
+            'server_total': time.time() - frame_request.received_at,
+        }
+        timings = {key: round(value, 4) for key, value in timings.items() if value is not None}
+        if frame_request.tokens is not None:
+            timings['tokens'] = frame_request.tokens
+        if frame_request.tokens_saved is not None:
+            timings['tokens_saved'] = frame_request.tokens_saved
+        return timings
+    
+    @staticmethod
+    def result_source(payload: dict) -> str:
+        """How a result was produced, for the results_total counter."""
+        if payload.get('superseded'):
+            return 'superseded'
+        if not payload.get('success'):
+            return 'error'
+        if 'scene_change' in payload:
+            return 'scene_skip'
+        if payload.get('cached'):
+            return 'response_cache'
+        return 'model'
+    
+    def metrics_text(self) -> str:
+        """Render /metrics: pipeline histograms and counters plus current gauges."""
+        with self.sessions_lock:
+            sessions = [session for session in self.sessions.values() if session.camera is None]
+        worker = self.worker.stats()
+        pipeline = self.pipeline_stats()
+        caches = {name: pipeline[f'{name}_cache'] for name in ('response', 'embedding', 'prompt')}
+        return self.metrics.render([
+            ('queue_depth', "Frames waiting for the inference worker.", 'gauge',
+             [({}, worker['queue_depth'])]),
+            ('queue_capacity', "Maximum frames that may wait for the inference worker.", 'gauge',
+             [({}, worker['max_queue'])]),
+            ('superseded_total', "Pending frames replaced by a newer frame from the same client.", 'counter',
+             [({}, worker['superseded'])]),
+            ('batches_total', "Model batches run by the inference worker.", 'counter',
+             [({}, worker['batches'])]),
+            ('sessions', "Connected clients, and those with a frame being processed.", 'gauge',
+             [({'state': 'connected'}, len(sessions)),
+              ({'state': 'in_flight'}, sum(1 for session in sessions if session.in_flight))]),
+            ('model_ready', "1 once the model is loaded and warmed up.", 'gauge',
+             [({}, int(self.model_ready.is_set()))]),
+            ('tokens_per_second', "Decode rate of the latest generation.", 'gauge',
+             [({}, round(self.metrics.tokens_per_sec, 3))]),
+            ('cache_hits_total', "Cache lookups that hit.", 'counter',
+             [({'cache': name}, stats['hits']) for name, stats in caches.items()]),
+            ('cache_misses_total', "Cache lookups that missed.", 'counter',
+             [({'cache': name}, stats['misses']) for name, stats in caches.items()]),
+            ('cache_hit_ratio', "Share of cache lookups that hit.", 'gauge',
+             [({'cache': name}, round(stats['hit_rate'], 4)) for name, stats in caches.items()]),
+        ] + self.quality_gauges() + self.process_gauges())
+    
+    def quality_gauges(self) -> list:
+        """Current adaptive quality level, when the controller is on."""
+        if self.quality is None:
+            return []
+        level = self.quality.current()
+        return [
+            ('quality_level', "Adaptive quality level in effect (0 is the cheapest).", 'gauge',
+             [({}, level['level'])]),
+            ('quality_image_edge', "Longest image edge processed at the current quality level.", 'gauge',
+             [({}, level['image_edge'])]),
+            ('quality_max_tokens', "max_tokens cap at the current quality level.", 'gauge',
+             [({}, level['max_tokens'])]),
+        ]
+    
+    @staticmethod
+    def process_usage() -> Optional[dict]:
+        """This process's CPU time and peak memory, where the platform reports them."""
+        if not RESOURCE_AVAILABLE:
+            return None
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        max_rss = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+        return {'cpu_seconds': round(usage.ru_utime + usage.ru_stime, 3), 'max_rss_bytes': max_rss}
+    
+    def process_gauges(self) -> list:
+        """CPU time and peak memory of the server process and, in pool mode, of each model worker."""
+        usages = [({'process': 'server'}, self.process_usage())]
+        if isinstance(self.worker, WorkerPool):
+            usages += [({'process': f'worker-{index}'}, usage)
+                       for index, usage in enumerate(self.worker.process_usages())]
+        usages = [(labels, usage) for labels, usage in usages if usage is not None]
+        if not usages:
+            return []
+        return [
+            ('process_cpu_seconds_total', "User and system CPU time of each server process.", 'counter',
+             [(labels, usage['cpu_seconds']) for labels, usage in usages]),
+            ('process_max_resident_memory_bytes', "Peak resident memory of each server process.", 'gauge',
+             [(labels, usage['max_rss_bytes']) for labels, usage in usages]),
+        ]
+    
+    def is_cacheable(self, frame_request: FrameRequest) -> bool:
+        """Deterministic answers are always cached; sampled ones only with cache_sampled."""
+        return frame_request.temperature == 0 or self.cache_sampled
+    
+    @staticmethod
+    def answer_fields(answer) -> dict:
+        """Result fields for a single response or a fan-out {prompt: response} map."""
+        if isinstance(answer, dict):
+            return {'responses': answer, 'response': "\n".join(answer.values())}
+        return {'response': answer}
+    
+    def remember_frame(self, frame_request: FrameRequest, image: EncodedImage):
+        """Keep a generated-from frame (with any features the backend attached) for follow-up prompts."""
+        self.embedding_cache.put(frame_request.frame_id, image)
+    
+    def remember_result(self, frame_request: FrameRequest, response, from_cache: bool = False):
+        """Record an answer for this exact frame for scene-change reuse and the response cache."""
+        if frame_request.cache_key is not None and not from_cache:
+            self.response_cache.put(frame_request.cache_key, response)
+        session = self.get_session(frame_request.sid)
+        if session is not None and frame_request.signature is not None:
+            # Remember what this frame looked like and what the model said about it.
+            # Scene-change skips don't get here, so slow drift still triggers a new analysis.
+            session.last_signature = frame_request.signature
+            session.last_generation_key = frame_request.generation_key()
+            session.last_response = response
+    
+    def scene_change_score(self, frame_request: FrameRequest) -> Optional[float]:
+        """Difference from the client's last analyzed frame, or None if it can't be reused."""
+        session = self.get_session(frame_request.sid)
+        if (self.scene_change_threshold <= 0 or session is None
+                or session.last_signature is None
+                or session.last_generation_key != frame_request.generation_key()):
+            return None
+        self.scene_checks += 1
+        return frame_difference(frame_request.signature, session.last_signature)
+    
+    def emit_superseded(self, frame_request: FrameRequest):
+        """Tell a client its pending frame was dropped in favour of a newer one."""
+        self.emit_result(frame_request, {
+            'success': False,
+            'superseded': True,
+            'error': 'Superseded by a newer frame'
+        })
+    
+    def emit_failed(self, frame_request: FrameRequest, error: Exception):
+        """Answer a frame whose batch failed outside the per-frame error handling, unless it was answered."""
+        if frame_request.answered:
+            return
+        self.metrics.inc('errors_total', type=type(error).__name__)
+        self.emit_result(frame_request, {
+            'success': False,
+            'error': f"Analysis error: {error}"
+        })
+    
+    def processing_size(self) -> int:
+        """Longest image edge the model processes."""
+        return self.backend.processing_size()
+    
+    def preprocess_frame(self, image_payload) -> Image.Image:
+        """Decode a frame and shrink it to the model's processing size.
+        
+        The payload is either raw JPEG bytes (binary Socket.IO attachment), a
+        base64 data URL from older clients, or an image a camera source has
+        already decoded and sized.
+        """
+        if isinstance(image_payload, Image.Image):
+            return image_payload
+        if isinstance(image_payload, (bytes, bytearray)):
+            # Binary upload: decode straight from the received buffer
+            image_bytes = image_payload
+        else:
+            # Decode base64 image
+            image_data = image_payload.split(',')[1]  # Remove data:image/jpeg;base64,
+            image_bytes = base64.b64decode(image_data)
+        
+        # Optimize image size according to SmolVLM recommendations
+        # SmolVLM uses 384x384 patches, so we optimize for that
+        image = self.run_blocking(decode_frame_image, image_bytes, self.processing_size())
+        
+        print(f"📸 Image processed: {image.size}")
+        return image
+    
+    def prepare_frame(self, frame_request: FrameRequest) -> Optional[EncodedImage]:
+        """Decode and encode a frame, or answer it without the model.
+        
+        Returns the encoded frame to generate from, or None if a result was
+        already sent (unchanged scene or cached response).
+        """
+        prepare_start = time.perf_counter()
+        encoded = None
+        if frame_request.image is None:
+            # reanalyze: the frame was uploaded earlier
+            encoded = self.embedding_cache.get(frame_request.frame_id) if frame_request.frame_id else None
+            if encoded is None:
+                raise ValueError("Frame is no longer cached, please send it again")
+            image = encoded.image
+        else:
+            decode_start = time.perf_counter()
+            image = self.preprocess_frame(frame_request.image)
+            frame_request.decode_time = time.perf_counter() - decode_start
+            self.metrics.observe('decode', frame_request.decode_time)
+            frame_request.frame_id = frame_hash(image)
+        session = self.get_session(frame_request.sid)
+        if session is not None:
+            session.last_frame_id = frame_request.frame_id
+        
+        # Skip inference if the scene hasn't changed since this client's last answer
+        if self.scene_change_threshold > 0:
+            frame_request.signature = frame_signature(image)
+            score = self.scene_change_score(frame_request)
+            if score is not None and score < self.scene_change_threshold:
+                self.scene_skips += 1
+                # The page offers "Ask Again" on this frame's id, so it must be cached like a generated one
+                if self.embedding_cache.get(frame_request.frame_id) is None:
+                    self.remember_frame(frame_request, EncodedImage.from_image(image))
+                self.finish_preprocess(frame_request, prepare_start)
+                self.emit_result(frame_request, {
+                    'success': True,
+                    **self.answer_fields(session.last_response),
+                    'cached': True,
+                    'scene_change': round(score, 4),
+                    'frame_id': frame_request.frame_id,
+                    'queue_wait': round(frame_request.queue_wait, 4)
+                })
+                return None
+        
+        # Identical image and settings answered before (e.g. a shared camera or a retry).
+        # Fan-out requests check the cache per prompt in fan_out_frame().
+        if not frame_request.prompts and self.is_cacheable(frame_request):
+            frame_request.cache_key = ResponseCache.make_key(
+                frame_request.frame_id, frame_request.prompt, frame_request.max_tokens, frame_request.temperature)
+            response = self.response_cache.get(frame_request.cache_key)
+            if response is not None:
+                self.remember_result(frame_request, response, from_cache=True)
+                self.finish_preprocess(frame_request, prepare_start)
+                self.emit_result(frame_request, {
+                    'success': True,
+                    'response': response,
+                    'cached': True,
+                    'frame_id': frame_request.frame_id,
+                    'queue_wait': round(frame_request.queue_wait, 4)
+                })
+                return None
+        
+        # Follow-up prompts on the same frame reuse its vision features
+        if encoded is None:
+            encoded = self.embedding_cache.get(frame_request.frame_id)
+        if encoded is None:
+            encoded = EncodedImage.from_image(image)
+        self.finish_preprocess(frame_request, prepare_start)
+        return encoded
+    
+    def apply_quality_level(self) -> Optional[dict]:
+        """Let the quality controller react to the load, and apply its level to the backend."""
+        if self.quality is None:
+            return None
+        if self.quality.update(self.worker.queue_depth()):
+            level = self.quality.current()
+            self.backend.set_image_edge(level['image_edge'])
+            print(f"🎚️ Quality level {level['level']}: {level['image_edge']}px, up to {level['max_tokens']} tokens")
+            # Clients capture frames at the new size from now on
+            self.send('server_config', self.server_config())
+        return self.quality.current()
+    
+    def finish_preprocess(self, frame_request: FrameRequest, prepare_start: float):
+        """Record the time prepare_frame() spent beyond decoding the upload."""
+        frame_request.preprocess_time = time.perf_counter() - prepare_start - frame_request.decode_time
+        self.metrics.observe('preprocess', frame_request.preprocess_time)
+    
+    def process_frame_batch(self, batch: list):
+        """Decode, preprocess and analyze a batch of frames. Runs on the inference worker."""
+        if not self.model_ready.is_set():
+            if not self.load_model():
+                for frame_request in batch:
+                    self.metrics.inc('errors_total', type='model_not_loaded')
+                    self.emit_result(frame_request, {
+                        'success': False,
+                        'error': 'Model not loaded'
+                    })
+                return
+        
+        quality = self.apply_quality_level()
+        
+        # Streaming requests run one at a time; the rest are grouped by
+        # generation parameters, which a batch must share
+        streams = []
+        fan_outs = []
+        groups = {}
+        for frame_request in batch:
+            session = self.get_session(frame_request.sid)
+            if session is not None:
+                session.in_flight = True
+            self.metrics.observe('queue_wait', frame_request.queue_wait)
+            if quality is not None:
+                frame_request.quality = quality
+                frame_request.max_tokens = min(frame_request.max_tokens, quality['max_tokens'])
+            try:
+                image = self.prepare_frame(frame_request)
+            except Exception as e:
+                error_msg = f"Analysis error: {str(e)}"
+                print(error_msg)
+                self.metrics.inc('errors_total', type=type(e).__name__)
+                self.emit_result(frame_request, {
+                    'success': False,
+                    'error': error_msg
+                })
+                continue
+            if image is None:
+                # Already answered without the model
+                continue
+            
+            if frame_request.prompts:
+                fan_outs.append((frame_request, image))
+                continue
+            if frame_request.stream:
+                streams.append((frame_request, image))
+                continue
+            key = (frame_request.max_tokens, frame_request.temperature)
+            groups.setdefault(key, []).append((frame_request, image))
+        
+        for frame_request, image in streams:
+            self.stream_frame(frame_request, image)
+        
+        for frame_request, image in fan_outs:
+            self.fan_out_frame(frame_request, image)
+        
+        for (max_tokens, temperature), items in groups.items():
+            try:
+                # Generate responses with speed optimizations
+                start_time = time.time()
+                
+                prompts = []
+                for frame_request, _ in items:
+                    prepared, frame_request.prefill_saved = self.backend.prepare_prompt(frame_request.prompt)
+                    prompts.append(prepared)
+                stoppers = [self.new_stopper(max_tokens) for _ in items]
+                
+                responses = self.run_blocking(
+                    self.backend.generate_batch,
+                    [image for _, image in items],
+                    prompts,
+                    max_tokens,
+                    temperature,
+                    stoppers
+                )
+                
+                inference_time = time.time() - start_time
+                self.metrics.observe_generation(self.backend.last_timings, inference_time)
+                # Without streaming the first token isn't observable; the backend's prefill is the closest
+                first_token = self.estimated_first_token()
+                print(f"Inference time: {inference_time:.2f}s (batch of {len(items)})")
+            except Exception as e:
+                error_msg = f"Analysis error: {str(e)}"
+                print(error_msg)
+                self.metrics.inc('errors_total', len(items), type=type(e).__name__)
+                for frame_request, _ in items:
+                    self.emit_result(frame_request, {
+                        'success': False,
+                        'error': error_msg
+                    })
+                continue
+            
+            for (frame_request, image), response, stopper in zip(items, responses, stoppers):
+                frame_request.generation_time = inference_time
+                frame_request.time_to_first_token = first_token
+                frame_request.tokens = self.backend.count_tokens(response)
+                self.record_tokens_saved(frame_request, [stopper])
+                response = clean_response(response)
+                self.remember_frame(frame_request, image)
+                self.remember_result(frame_request, response)
+                self.emit_result(frame_request, {
+                    'success': True,
+                    'response': response,
+                    'queue_wait': round(frame_request.queue_wait, 4),
+                    'prefill_saved': round(frame_request.prefill_saved, 4),
+                    'frame_id': frame_request.frame_id,
+                    'batch_size': len(items)
+                })
+                print(f"Analysis complete: {response[:100]}...")
+    
+    def new_stopper(self, max_tokens: int) -> Optional[SentenceStopper]:
+        """A fresh sentence-boundary stopper for one generation, or None with early stopping off."""
+        if not self.early_stop:
+            return None
+        return SentenceStopper(max_tokens, self.max_sentences)
+    
+    def record_tokens_saved(self, frame_request: FrameRequest, stoppers: list):
+        """Total up the tokens a request's stoppers saved, for its timings and /metrics."""
+        if not self.early_stop:
+            return
+        frame_request.tokens_saved = sum(stopper.tokens_saved for stopper in stoppers)
+        self.metrics.inc('tokens_saved_total', frame_request.tokens_saved)
+    
+    def estimated_first_token(self) -> Optional[float]:
+        """Vision encode plus prefill of the latest generation, if the backend reported them."""
+        timings = self.backend.last_timings
+        if 'prefill' not in timings:
+            return None
+        return timings.get('vision_encode', 0.0) + timings['prefill']
+    
+    def fan_out_frame(self, frame_request: FrameRequest, image: EncodedImage):
+        """Answer several prompts about one frame with a single batched generation."""
+        responses = {}
+        pending = []
+        cache_keys = {}
+        for prompt in frame_request.prompts:
+            if self.is_cacheable(frame_request):
+                cache_keys[prompt] = ResponseCache.make_key(
+                    frame_request.frame_id, prompt, frame_request.max_tokens, frame_request.temperature)
+                cached = self.response_cache.get(cache_keys[prompt])
+                if cached is not None:
+                    responses[prompt] = cached
+                    continue
+            pending.append(prompt)
+        
+        try:
+            start_time = time.time()
+            prefill_saved = 0.0
+            prepared_prompts = []
+            for prompt in pending:
+                prepared, saved = self.backend.prepare_prompt(prompt)
+                prepared_prompts.append(prepared)
+                prefill_saved += saved
+            frame_request.prefill_saved = prefill_saved
+            stoppers = [self.new_stopper(frame_request.max_tokens) for _ in pending]
+            
+            # The same decoded frame for every prompt. mlx-vlm's batch_generate still runs the
+            # vision encoder on each copy, so only the upload, decode and resize are shared
+            raw_responses = self.run_blocking(
+                self.backend.generate_batch,
+                [image] * len(pending),
+                prepared_prompts,
+                frame_request.max_tokens,
+                frame_request.temperature,
+                stoppers
+            ) if pending else []
+            
+            inference_time = time.time() - start_time
+            if pending:
+                self.metrics.observe_generation(self.backend.last_timings, inference_time)
+                frame_request.generation_time = inference_time
+                frame_request.time_to_first_token = self.estimated_first_token()
+                frame_request.tokens = sum(self.backend.count_tokens(response) for response in raw_responses)
+                self.record_tokens_saved(frame_request, stoppers)
+            print(f"Inference time: {inference_time:.2f}s ({len(pending)} of {len(frame_request.prompts)} prompts generated)")
+        except Exception as e:
+            error_msg = f"Analysis error: {str(e)}"
+            print(error_msg)
+            self.metrics.inc('errors_total', type=type(e).__name__)
+            self.emit_result(frame_request, {
+                'success': False,
+                'error': error_msg
+            })
+            return
+        
+        for prompt, response in zip(pending, raw_responses):
+            responses[prompt] = clean_response(response)
+            if prompt in cache_keys:
+                self.response_cache.put(cache_keys[prompt], responses[prompt])
+        # Keep the client's prompt order
+        responses = {prompt: responses[prompt] for prompt in frame_request.prompts}
+        
+        self.remember_frame(frame_request, image)
+        self.remember_result(frame_request, responses)
+        self.emit_result(frame_request, {
+            'success': True,
+            **self.answer_fields(responses),
+            'queue_wait': round(frame_request.queue_wait, 4),
+            'prefill_saved': round(frame_request.prefill_saved, 4),
+            'frame_id': frame_request.frame_id,
+            'prompts_cached': len(frame_request.prompts) - len(pending)
+        })
+        print(f"Analysis complete: {len(responses)} prompts answered")
+    
+    def iterate_blocking(self, iterator):
+        """Iterate a blocking generator, advancing it with run_blocking()."""
+        done = object()
+        while True:
+            item = self.run_blocking(next, iterator, done)
+            if item is done:
+                return
+            yield item
+    
+    def stream_frame(self, frame_request: FrameRequest, image: EncodedImage):
+        """Generate one response, emitting each decoded chunk as an analysis_token event."""
+        try:
+            start_time = time.time()
+            first_token_time = None
+            chunks = []
+            prepared, frame_request.prefill_saved = self.backend.prepare_prompt(frame_request.prompt)
+            stopper = self.new_stopper(frame_request.max_tokens)
+            tokens = self.backend.stream_generate(
+                image, prepared, frame_request.max_tokens, frame_request.temperature, stopper)
+            try:
+                for chunk in self.iterate_blocking(tokens):
+                    if not chunk:
+                        continue
+                    if first_token_time is None:
+                        first_token_time = time.time() - start_time
+                    if self.get_session(frame_request.sid) is None:
+                        # Client is gone: stop decoding for nobody
+                        print("Client disconnected mid-stream, generation stopped")
+                        return
+                    chunks.append(chunk)
+                    self.send('analysis_token', {'token': chunk}, to=frame_request.sid)
+            finally:
+                # Closing the backend's generator is what stops its decoding when we leave early
+                self.run_blocking(tokens.close)
+            
+            inference_time = time.time() - start_time
+            self.metrics.observe_generation(self.backend.last_timings, inference_time)
+            print(f"Inference time: {inference_time:.2f}s (streamed, first token {first_token_time or 0:.2f}s)")
+        except Exception as e:
+            error_msg = f"Analysis error: {str(e)}"
+            print(error_msg)
+            self.metrics.inc('errors_total', type=type(e).__name__)
+            self.emit_result(frame_request, {
+                'success': False,
+                'error': error_msg
+            })
+            return
+        
+        frame_request.generation_time = inference_time
+        frame_request.time_to_first_token = first_token_time or inference_time
+        # Each streamed chunk is one decoded token
+        frame_request.tokens = len(chunks)
+        self.record_tokens_saved(frame_request, [stopper])
+        
+        # The final event carries the cleaned-up text, which replaces the streamed draft
+        response = clean_response("".join(chunks))
+        self.remember_frame(frame_request, image)
+        self.remember_result(frame_request, response)
+        self.emit_result(frame_request, {
+            'success': True,
+            'response': response,
+            'streamed': True,
+            'queue_wait': round(frame_request.queue_wait, 4),
+            'prefill_saved': round(frame_request.prefill_saved, 4),
+            'frame_id': frame_request.frame_id,
+            'time_to_first_token': round(first_token_time or inference_time, 4)
+        })
+        print(f"Analysis complete: {response[:100]}...")
+    
+    def run(self):
+        """Run the web server."""
+        print(f"Starting MLX SmolVLM Web Server...")
+        print(f"Open your browser and go to: http://{self.host}:{self.port}")
+        print("Press Ctrl+C to stop the server")
+        
+        try:
+            if self.production:
+                # eventlet/gevent serve WebSockets natively; no access log per request
+                print(f"🏭 Production mode ({self.socketio.async_mode}, WebSocket only)")
+                self.socketio.run(self.app, host=self.host, port=self.port, log_output=False)
+                return
+            self.socketio.run(
+                self.app,
+                host=self.host,
+                port=self.port,
+                debug=True,
+                allow_unsafe_werkzeug=True,
+                use_reloader=False,
+                log_output=True
+            )
+        except KeyboardInterrupt:
+            print("\nShutting down server...")
+
+class PoolWorkerServer(MLXSmolVLMWebServer):
+    """The inference pipeline inside a pool worker process.
+
+    Nothing is served from here: frames arrive from the front end's WorkerPool
+    and every event goes back to it over the results queue.
+    """
+
+    def __init__(self, index: int, results, **kwargs):
+        self.index = index
+        self.results = results
+        super().__init__('pool-worker', **kwargs)
+
+    def send(self, event: str, payload: dict, to: Optional[str] = None):
+        self.results.put((self.index, event, payload, to))
+
+    def emit_result(self, frame_request: FrameRequest, payload: dict):
+        super().emit_result(frame_request, payload)
+        self.report_stats()
+
+    def set_model_state(self, state: str):
+        super().set_model_state(state)
+        if state == 'ready':
+            # A baseline before the first frame, so CPU spent loading isn't counted against traffic
+            self.report_stats()
+
+    def report_stats(self):
+        """Send this worker's cache, scene-change and process stats; the front end's own sit unused."""
+        self.send('pipeline_stats', {**self.pipeline_stats(), 'process': self.process_usage()})
+
+    def accept(self, frame_request: FrameRequest):
+        """Queue a frame from the front end, tracking its client like a connection would."""
+        with self.sessions_lock:
+            if frame_request.sid not in self.sessions:
+                self.sessions[frame_request.sid] = ClientSession(sid=frame_request.sid, connected_at=time.time())
+        if not self.worker.submit(frame_request):
+            self.emit_result(frame_request, {
+                'success': False,
+                'error': 'Server busy, frame dropped',
+                'queue_depth': self.worker.queue_depth()
+            })
+
+    def drop_session(self, sid: str):
+        """The client disconnected: forget it and drop its pending frames."""
+        with self.sessions_lock:
+            self.sessions.pop(sid, None)
+        self.worker.cancel(sid)
+
+
+def pool_worker_main(index: int, config: dict, requests, results):
+    """Entry point of a model worker process: build the pipeline, then serve frames from the queue."""
+    backend = create_backend(**config['backend'])
+    server = PoolWorkerServer(
+        index, results,
+        backend=backend,
+        response_cache=ResponseCache(**config['response_cache']),
+        embedding_cache=EmbeddingCache(max_bytes=config['embedding_cache_bytes']),
+        **config['server']
+    )
+    server.start_model_load()
+    while True:
+        kind, value = requests.get()
+        if kind == 'frame':
+            server.accept(value)
+        elif kind == 'cancel':
+            server.drop_session(value)
+
+
+# Offline batch mode: caption recorded footage without the web server
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.webm', '.m4v')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+@dataclass
+class BatchFrame:
+    """One sampled frame of an offline input, before and after preprocessing."""
+    source: str
+    frame: int
+    # Seconds into the video; None for image directories
+    timestamp: Optional[float]
+    # Raw BGR array (video) or file path (image), replaced by an EncodedImage once preprocessed
+    data: Any
+    # The image's file path; None for videos
+    image: Optional[str] = None
+
+
+def iter_video_frames(path: str, fps: float, done: Callable[[int], bool]):
+    """Yield (frame index, timestamp, BGR array) for a video sampled at `fps` (0 keeps every frame).
+
+    Skipped frames, and those `done` says were already captioned, are only
+    grabbed, not decoded.
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Cannot open video: {path}")
+    native_fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    step = 1.0 / fps if fps > 0 else 0.0
+    next_sample = 0.0
+    index = 0
+    try:
+        while capture.grab():
+            timestamp = index / native_fps
+            if timestamp + 1e-6 >= next_sample:
+                next_sample += step
+                if not done(index):
+                    ok, frame = capture.retrieve()
+                    if ok:
+                        yield index, timestamp, frame
+            index += 1
+    finally:
+        capture.release()
+
+
+def iter_batch_frames(inputs: list, fps: float, done: set):
+    """Yield a BatchFrame per sampled frame of each video file or image directory in `inputs`.
+
+    Frames in `done` are skipped: video frames by (source, index), images by
+    (source, path), so a directory's contents can change between runs.
+    """
+    for path in inputs:
+        if os.path.isdir(path):
+            names = sorted(name for name in os.listdir(path) if name.lower().endswith(IMAGE_EXTENSIONS))
+            for index, name in enumerate(names):
+                image = os.path.join(path, name)
+                if (path, image) not in done:
+                    yield BatchFrame(path, index, None, image, image=image)
+        elif path.lower().endswith(VIDEO_EXTENSIONS):
+            if not CV2_AVAILABLE:
+                raise ValueError(f"Reading {path} needs OpenCV. Install with: pip install opencv-python")
+            for index, timestamp, frame in iter_video_frames(path, fps, lambda i: (path, i) in done):
+                yield BatchFrame(path, index, round(timestamp, 3), frame)
+        else:
+            raise ValueError(f"Not a video file or image directory: {path}")
+
+
+def prefetch(items, fn: Callable, workers: int, depth: int):
+    """Yield fn(item) for each item, in order, computing up to `depth` ahead in a thread pool.
+
+    A feeder thread pulls from `items` (which may itself do I/O, like
+    reading video) so the consumer only ever waits on finished work.
+    Exceptions from `items` or `fn` are re-raised in the consumer.
+    """
+    pending = queue.Queue(maxsize=depth)
+    finished = object()
+    stop = threading.Event()
+
+    def feed(executor):
+        try:
+            for item in items:
+                if stop.is_set():
+                    return
+                pending.put(executor.submit(fn, item))
+        except Exception as e:
+            pending.put(e)
+        pending.put(finished)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        feeder = threading.Thread(target=feed, args=(executor,), daemon=True)
+        feeder.start()
+        try:
+            while True:
+                future = pending.get()
+                if future is finished:
+                    return
+                if isinstance(future, Exception):
+                    raise future
+                yield future.result()
+        finally:
+            # Unblock the feeder if the consumer stopped early
+            stop.set()
+            while feeder.is_alive():
+                try:
+                    pending.get_nowait()
+                except queue.Empty:
+                    feeder.join(0.05)
+
+
+def load_checkpoint(path: str) -> set:
+    """Return the frames already written to a JSONL output file, keyed as iter_batch_frames() expects.
+
+    A partially written last line (from an interrupted run) is cut off so
+    appending continues on a clean line. Lines that aren't caption records
+    are kept but ignored.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, 'rb+') as f:
+        good_end = 0
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            good_end += len(line)
+            if not isinstance(record, dict) or 'source' not in record or 'frame' not in record:
+                continue
+            image = record.get('image')
+            done.add((record['source'], image if image is not None else record['frame']))
+        f.truncate(good_end)
+    return done
+
+
+def batch_main(argv: list) -> int:
+    """Caption video files and image directories offline, writing one JSON line per frame."""
+    parser = argparse.ArgumentParser(prog="mlx_smolvlm_webcam.py batch",
+                                     description="Caption video files and image directories to JSONL")
+    parser.add_argument("inputs", nargs="+", help="Video files and/or directories of images")
+    parser.add_argument("--output", type=str, required=True,
+                       help="JSONL file to write results to; appended to when resuming")
+    parser.add_argument("--prompt", type=str, default="What do you see?",
+                       help="Prompt asked about every frame (default: What do you see?)")
+    parser.add_argument("--fps", type=float, default=1.0,
+                       help="Frames per second sampled from videos, 0 for every frame (default: 1)")
+    parser.add_argument("--max-tokens", type=int, default=100,
+                       help="Maximum tokens per response (default: 100)")
+    parser.add_argument("--temperature", type=float, default=0.0,
+                       help="Sampling temperature (default: 0.0)")
+    parser.add_argument("--batch-size", type=int, default=4,
+                       help="Frames run through the model in one batch (default: 4)")
+    parser.add_argument("--max-sentences", type=int, default=0,
+                       help="Stop generating after this many complete sentences, 0 for no limit (default: 0)")
+    parser.add_argument("--no-early-stop", action="store_true",
+                       help="Always decode the full token budget and trim to complete sentences afterwards")
+    parser.add_argument("--decode-workers", type=int, default=2,
+                       help="Threads decoding and preprocessing frames ahead of the model (default: 2)")
+    parser.add_argument("--no-resume", action="store_true",
+                       help="Overwrite the output file instead of skipping frames it already has")
+    parser.add_argument("--progress-every", type=int, default=50,
+                       help="Print progress every N frames (default: 50)")
+    parser.add_argument("--model", type=str, default="mlx-community/SmolVLM-Instruct-4bit",
+                       help="Path or HuggingFace model ID for SmolVLM model")
+    parser.add_argument("--backend", type=str, choices=["mlx", "stub"], default="mlx",
+                       help="Inference backend: mlx (Apple Silicon) or stub (CPU, for testing)")
+    parser.add_argument("--stub-latency", type=float, default=0.5,
+                       help="Stub backend: fixed latency per generation in seconds (default: 0.5)")
+    parser.add_argument("--stub-tokens-per-sec", type=float, default=40.0,
+                       help="Stub backend: simulated decode rate in tokens/sec (default: 40)")
+    args = parser.parse_args(argv)
+
+    if args.backend == "mlx" and not MLX_VLM_AVAILABLE:
+        print("Error: mlx-vlm is required. Install with: pip install mlx-vlm")
+        return 1
+
+    done = set()
+    if args.no_resume:
+        open(args.output, 'w').close()
+    else:
+        done = load_checkpoint(args.output)
+        if done:
+            print(f"⏩ Resuming: {len(done)} frames already in {args.output}")
+
+    backend = create_backend(args.backend, args.model, stub_latency=args.stub_latency,
+                             stub_tokens_per_sec=args.stub_tokens_per_sec)
+    print(f"🔄 Loading model: {args.model}")
+    backend.load()
+    edge = backend.processing_size()
+    prepared, _ = backend.prepare_prompt(args.prompt)
+
+    def preprocess(item: BatchFrame) -> BatchFrame:
+        if isinstance(item.data, str):
+            with open(item.data, 'rb') as f:
+                image = decode_frame_image(f.read(), edge)
+        else:
+            image = frame_from_array(item.data, edge)
+        item.data = EncodedImage.from_image(image)
+        return item
+
+    def batches(items):
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) == args.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    frames = prefetch(iter_batch_frames(args.inputs, args.fps, done), preprocess,
+                      workers=args.decode_workers, depth=args.batch_size * 2)
+    processed = 0
+    tokens_saved = 0
+    start_time = time.time()
+    try:
+        with open(args.output, 'a') as out:
+            for batch in batches(frames):
+                stoppers = None
+                if not args.no_early_stop:
+                    stoppers = [SentenceStopper(args.max_tokens, args.max_sentences) for _ in batch]
+                responses = backend.generate_batch([item.data for item in batch], [prepared] * len(batch),
+                                                   args.max_tokens, args.temperature, stoppers)
+                tokens_saved += sum(stopper.tokens_saved for stopper in stoppers or [])
+                for item, response in zip(batch, responses):
+                    out.write(json.dumps({'source': item.source, 'frame': item.frame, 'image': item.image,
+                                          'timestamp': item.timestamp, 'prompt': args.prompt,
+                                          'response': clean_response(response)}) + "\n")
+                # Flush per batch so an interrupted run can resume from here
+                out.flush()
+                processed += len(batch)
+                if processed // args.progress_every != (processed - len(batch)) // args.progress_every:
+                    print(f"🎞️ {processed} frames, {processed / (time.time() - start_time):.2f} frames/sec")
+    except KeyboardInterrupt:
+        print("\n⏸️ Interrupted; rerun the same command to resume")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        return 1
+
+    elapsed = time.time() - start_time
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    print(f"✅ {processed} frames in {elapsed:.1f}s ({rate:.2f} frames/sec) -> {args.output}")
+    if tokens_saved:
+        print(f"✂️ Stopping at sentence ends saved {tokens_saved} tokens")
+    return 0
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        return batch_main(sys.argv[2:])
+
+    parser = argparse.ArgumentParser(description="MLX SmolVLM Real-time Webcam Web Server")
+    parser.add_argument("--model", type=str, default="mlx-community/SmolVLM-Instruct-4bit",
+                       help="Path or HuggingFace model ID for SmolVLM model. Recommended: HuggingFaceTB/SmolVLM-Instruct")
+    parser.add_argument("--host", type=str, default="127.0.0.1",
+                       help="Host to bind the server (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8080,
+                       help="Port to bind the server (default: 8080)")
+    parser.add_argument("--debug", action="store_true",
+                       help="Enable debug mode")
+    parser.add_argument("--max-queue", type=int, default=8,
+                       help="Maximum frames waiting for the inference worker before new ones are dropped (default: 8)")
+    parser.add_argument("--max-batch-size", type=int, default=4,
+                       help="Maximum frames run through the model in one batch (default: 4)")
+    parser.add_argument("--batch-window", type=float, default=0.05,
+                       help="Seconds to wait for more frames before running a batch (default: 0.05)")
+    parser.add_argument("--jpeg-quality", type=int, default=80,
+                       help="JPEG quality (1-100) clients encode frames at (default: 80)")
+    parser.add_argument("--scene-change-threshold", type=float, default=0.02,
+                       help="Reuse a client's last answer when its frame differs from the last analyzed one "
+                            "by less than this (0-1, 0 disables; default: 0.02)")
+    parser.add_argument("--cache-entries", type=int, default=256,
+                       help="Response cache size in entries, 0 disables it (default: 256)")
+    parser.add_argument("--cache-bytes", type=int, default=1024 * 1024,
+                       help="Response cache size limit in bytes (default: 1 MiB)")
+    parser.add_argument("--cache-ttl", type=float, default=0,
+                       help="Seconds a cached response stays valid, 0 for no expiry (default: 0)")
+    parser.add_argument("--cache-sampled", action="store_true",
+                       help="Also cache responses generated with temperature > 0")
+    parser.add_argument("--embedding-cache-mb", type=int, default=256,
+                       help="Memory for encoded frames kept for follow-up prompts, in MiB (default: 256)")
+    parser.add_argument("--preload", action="store_true",
+                       help="Load and warm up the model in the background at startup instead of on the first connection")
+    parser.add_argument("--no-warmup", action="store_true",
+                       help="Skip the warm-up generation that compiles kernels before the first frame")
+    parser.add_argument("--max-sentences", type=int, default=0,
+                       help="Stop generating after this many complete sentences, 0 for no limit (default: 0)")
+    parser.add_argument("--no-early-stop", action="store_true",
+                       help="Always decode the full token budget and trim to complete sentences afterwards")
+    parser.add_argument("--target-p95", type=float, default=0,
+                       help="Adapt image resolution and max_tokens to hold this p95 latency in seconds, 0 disables (default: 0)")
+    parser.add_argument("--quality-ladder", type=str, default="384:20,768:30,1152:45,1536:60",
+                       help="Quality levels for --target-p95 as edge:max_tokens pairs (default: 384:20,768:30,1152:45,1536:60)")
+    parser.add_argument("--quality-window", type=float, default=10.0,
+                       help="Seconds of recent latencies --target-p95 is judged on (default: 10)")
+    parser.add_argument("--quality-min-samples", type=int, default=8,
+                       help="Latencies needed before a quality change; with fewer, a full window must pass (default: 8)")
+    parser.add_argument("--no-coalesce", action="store_true",
+                       help="Process every frame instead of letting a client's newest frame replace its pending one")
+    parser.add_argument("--production", action="store_true",
+                       help="Serve with an async server (see --async-mode), WebSocket only, without packet logging")
+    parser.add_argument("--async-mode", type=str, choices=["gevent", "eventlet"], default="gevent",
+                       help="Async server for --production (default: gevent)")
+    parser.add_argument("--workers", type=int, default=1,
+                       help="Model worker processes, each holding its own model; 1 runs the model in-process (default: 1)")
+    parser.add_argument("--camera", type=str, action="append", default=[], metavar="NAME=URL",
+                       help="Analyze a server-side source: RTSP/HTTP MJPEG URL, V4L2 device (0, /dev/video0) "
+                            "or looping video file. Repeat for several cameras")
+    parser.add_argument("--camera-interval", type=float, default=2.0,
+                       help="Seconds between analyses of each camera and camera room (default: 2)")
+    parser.add_argument("--camera-prompt", type=str, default="What do you see?",
+                       help="Prompt asked about camera frames (default: What do you see?)")
+    parser.add_argument("--max-camera-rooms", type=int, default=16,
+                       help="Browser-fed camera rooms that may be open at once (default: 16)")
+    parser.add_argument("--backend", type=str, choices=["mlx", "stub"], default="mlx",
+                       help="Inference backend: mlx (Apple Silicon) or stub (CPU, for load testing)")
+    parser.add_argument("--stub-latency", type=float, default=0.5,
+                       help="Stub backend: fixed latency per generation in seconds (default: 0.5)")
+    parser.add_argument("--stub-tokens-per-sec", type=float, default=40.0,
+                       help="Stub backend: simulated decode rate in tokens/sec (default: 40)")
+    parser.add_argument("--stub-prefix-cache", action="store_true",
+                       help="Stub backend: skip text prefill for repeated prompts, modelling a prompt KV cache")
+    parser.add_argument("--stub-vision-cache", action="store_true",
+                       help="Stub backend: skip the vision encoder for cached frames, modelling a vision feature cache")
+    
+    args = parser.parse_args()
+    try:
+        quality_ladder = parse_quality_ladder(args.quality_ladder)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    # Try different hosts if localhost fails
+    if args.host == "localhost":
+        args.host = "127.0.0.1"
+    
+    print(f"🚀 Starting MLX SmolVLM Web Server...")
+    if args.backend == "mlx" and not MLX_VLM_AVAILABLE:
+        print("Error: mlx-vlm is required. Install with: pip install mlx-vlm")
+        print("💡 Use --backend stub to run without a model")
+        return 1
+    
+    async_mode = 'threading'
+    if args.production:
+        async_mode = args.async_mode
+        try:
+            patch_for_async_mode(async_mode)
+        except ImportError:
+            print(f"Error: --production needs {async_mode}. Install with: pip install {async_mode}")
+            return 1
+    
+    print(f"📱 Model: {args.model}")
+    print(f"🧩 Backend: {args.backend}")
+    print(f"🌐 Server: http://{args.host}:{args.port}")
+    print(f"🔧 Debug: {args.debug}")
+    print("=" * 50)
+    
+    # Everything a worker process needs to build the same pipeline (--workers > 1)
+    worker_config = {
+        'backend': {'name': args.backend, 'model_path': args.model,
+                    'stub_latency': args.stub_latency, 'stub_tokens_per_sec': args.stub_tokens_per_sec,
+                    'stub_prefix_cache': args.stub_prefix_cache,
+                    'stub_vision_cache': args.stub_vision_cache},
+        'response_cache': {'max_entries': args.cache_entries, 'max_bytes': args.cache_bytes,
+                           'ttl': args.cache_ttl or None},
+        'embedding_cache_bytes': args.embedding_cache_mb * 1024 * 1024,
+        'server': {'max_queue': args.max_queue, 'max_batch_size': args.max_batch_size,
+                   'batch_window': args.batch_window, 'coalesce': not args.no_coalesce,
+                   'jpeg_quality': args.jpeg_quality, 'scene_change_threshold': args.scene_change_threshold,
+                   'cache_sampled': args.cache_sampled, 'warm_up': not args.no_warmup,
+                   'early_stop': not args.no_early_stop, 'max_sentences': args.max_sentences,
+                   'target_p95': args.target_p95, 'quality_ladder': quality_ladder,
+                   'quality_window': args.quality_window, 'quality_min_samples': args.quality_min_samples},
+    }
     
     try:
         server = MLXSmolVLMWebServer(
             model_path=args.model,
             host=args.host,
-            port=args.port
+            port=args.port,
+            max_queue=args.max_queue,
+            max_batch_size=args.max_batch_size,
+            batch_window=args.batch_window,
+            coalesce=not args.no_coalesce,
+            jpeg_quality=args.jpeg_quality,
+            scene_change_threshold=args.scene_change_threshold,
+            response_cache=ResponseCache(max_entries=args.cache_entries, max_bytes=args.cache_bytes,
+                                         ttl=args.cache_ttl or None),
+            cache_sampled=args.cache_sampled,
+            embedding_cache=EmbeddingCache(max_bytes=args.embedding_cache_mb * 1024 * 1024),
+            warm_up=not args.no_warmup,
+            early_stop=not args.no_early_stop,
+            max_sentences=args.max_sentences,
+            target_p95=args.target_p95,
+            quality_ladder=quality_ladder,
+            quality_window=args.quality_window,
+            quality_min_samples=args.quality_min_samples,
+            camera_interval=args.camera_interval,
+            max_camera_rooms=args.max_camera_rooms,
+            production=args.production,
+            async_mode=async_mode,
+            workers=args.workers,
+            worker_config=worker_config,
+            backend=create_backend(args.backend, args.model,
+                                   stub_latency=args.stub_latency,
+                                   stub_tokens_per_sec=args.stub_tokens_per_sec,
+                                   stub_prefix_cache=args.stub_prefix_cache,
+                                   stub_vision_cache=args.stub_vision_cache)
         )
+        if args.preload:
+            server.start_model_load()
+        for i, spec in enumerate(args.camera):
+            name, url = parse_camera_spec(spec, default_name=f"camera{i + 1}")
+            server.add_camera(name, url, interval=args.camera_interval, prompt=args.camera_prompt)
         server.run()
     except PermissionError:
         print(f"❌ Permission denied on port {args.port}")